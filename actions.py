@@ -6,54 +6,52 @@ the order's status inside the caller's transaction (no commit here).
 
 import logging
 import sqlite3
-from datetime import datetime, timezone
+
+from database import utc_now as _now
 
 logger = logging.getLogger(__name__)
 
 
-def _now() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def _raise_transition_error(conn: sqlite3.Connection, order_id: str, expected: str, verb: str) -> None:
+    """Explain why a conditional status UPDATE matched no row. Only runs on failure."""
+    row = conn.execute("SELECT status FROM orders WHERE id = ?", (order_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"Order {order_id} not found")
+    if row["status"] != expected:
+        raise ValueError(f"Cannot {verb} order in '{row['status']}' status (expected '{expected}')")
 
 
 def validate_order(conn: sqlite3.Connection, order_id: str) -> None:
     """Transition order: pending -> validated. Checks amount > 0."""
-    row = conn.execute("SELECT status, amount FROM orders WHERE id = ?", (order_id,)).fetchone()
-    if row is None:
-        raise ValueError(f"Order {order_id} not found")
-    if row["status"] != "pending":
-        raise ValueError(f"Cannot validate order in '{row['status']}' status (expected 'pending')")
-    if row["amount"] <= 0:
-        raise ValueError(f"Order amount must be > 0, got {row['amount']}")
-    conn.execute(
-        "UPDATE orders SET status = 'validated', updated_at = ? WHERE id = ?",
+    cur = conn.execute(
+        "UPDATE orders SET status = 'validated', updated_at = ? "
+        "WHERE id = ? AND status = 'pending' AND amount > 0",
         (_now(), order_id),
     )
+    if cur.rowcount == 0:
+        _raise_transition_error(conn, order_id, "pending", "validate")
+        amount = conn.execute("SELECT amount FROM orders WHERE id = ?", (order_id,)).fetchone()[0]
+        raise ValueError(f"Order amount must be > 0, got {amount}")
 
 
 def charge_payment(conn: sqlite3.Connection, order_id: str) -> None:
     """Transition order: validated -> charged."""
-    row = conn.execute("SELECT status FROM orders WHERE id = ?", (order_id,)).fetchone()
-    if row is None:
-        raise ValueError(f"Order {order_id} not found")
-    if row["status"] != "validated":
-        raise ValueError(f"Cannot charge order in '{row['status']}' status (expected 'validated')")
-    conn.execute(
-        "UPDATE orders SET status = 'charged', updated_at = ? WHERE id = ?",
+    cur = conn.execute(
+        "UPDATE orders SET status = 'charged', updated_at = ? WHERE id = ? AND status = 'validated'",
         (_now(), order_id),
     )
+    if cur.rowcount == 0:
+        _raise_transition_error(conn, order_id, "validated", "charge")
 
 
 def ship_order(conn: sqlite3.Connection, order_id: str) -> None:
     """Transition order: charged -> shipped."""
-    row = conn.execute("SELECT status FROM orders WHERE id = ?", (order_id,)).fetchone()
-    if row is None:
-        raise ValueError(f"Order {order_id} not found")
-    if row["status"] != "charged":
-        raise ValueError(f"Cannot ship order in '{row['status']}' status (expected 'charged')")
-    conn.execute(
-        "UPDATE orders SET status = 'shipped', updated_at = ? WHERE id = ?",
+    cur = conn.execute(
+        "UPDATE orders SET status = 'shipped', updated_at = ? WHERE id = ? AND status = 'charged'",
         (_now(), order_id),
     )
+    if cur.rowcount == 0:
+        _raise_transition_error(conn, order_id, "charged", "ship")
 
 
 def send_notification(conn: sqlite3.Connection, order_id: str) -> None:
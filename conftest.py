@@ -0,0 +1,68 @@
+"""Shared pytest fixtures: a temp SQLite database per test module, emptied before each test."""
+
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import database
+import tasks
+from database import get_connection, init_db
+from executor import shutdown_run_pool
+
+# Children before parents, for the foreign keys.
+TRUNCATE_SQL = """
+    DELETE FROM step_results;
+    DELETE FROM steps;
+    DELETE FROM runs;
+    DELETE FROM orders;
+    DELETE FROM workflows;
+"""
+
+
+def _remove_db_files(path: str) -> None:
+    for name in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema(request):
+    """Create the module's temp DB and its schema once per test module."""
+    # One file per module and pytest-xdist worker, so parallel workers never share a database
+    test_db = f"/tmp/{request.module.__name__}_{os.environ.get('PYTEST_XDIST_WORKER', 'main')}.db"
+    database.DB_PATH = database.Path(test_db)
+    database.close_cached_connections()
+    _remove_db_files(test_db)
+    init_db()
+    yield
+    # Background runs still hold connections to the file until they stop
+    shutdown_run_pool(wait=True)
+    database.close_cached_connections()
+    _remove_db_files(test_db)
+
+
+@pytest.fixture(autouse=True)
+def no_task_sleep(monkeypatch):
+    """Skip execute_task's simulated duration; tests assert on state, not wall time.
+
+    Replaces the `time` module as tasks sees it, so time.sleep elsewhere is untouched.
+    """
+    monkeypatch.setattr(tasks, "time", SimpleNamespace(sleep=lambda seconds: None))
+
+
+@pytest.fixture(autouse=True)
+def setup_db(schema):
+    """Start every test with empty tables."""
+    c = get_connection()
+    try:
+        c.executescript(TRUNCATE_SQL)
+    finally:
+        c.close()
+
+
+@pytest.fixture
+def conn():
+    c = get_connection()
+    yield c
+    c.close()
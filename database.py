@@ -1,17 +1,267 @@
+import queue
 import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Generator
 
 DB_PATH = Path(__file__).parent / "workflow.db"
 
+# PRAGMAs are per-connection, so every connection gets the full bundle.
+# WAL + synchronous=NORMAL makes each commit a WAL append without an fsync;
+# a power loss can drop the last few commits but never corrupts the database.
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=134217728;
+    PRAGMA cache_size=-20000;
+    PRAGMA foreign_keys=ON;
+"""
+
+
+# Prepared-statement cache per connection (sqlite3 default: 128). The app's SQL
+# texts are stable, so with room for all of them nothing is re-parsed on
+# long-lived worker connections.
+CACHED_STATEMENTS = 256
+
 
 def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(str(DB_PATH), timeout=10, check_same_thread=False)
+    # busy timeout is set via timeout=10 (equivalent to PRAGMA busy_timeout=10000)
+    conn = sqlite3.connect(
+        str(DB_PATH), timeout=10, check_same_thread=False, cached_statements=CACHED_STATEMENTS
+    )
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(CONNECTION_PRAGMAS)
     return conn
 
 
+# (epoch second, "YYYY-MM-DDTHH:MM:SS") of the last utc_now() call. Replaced as a
+# whole tuple, so concurrent callers at worst format the same second twice.
+_now_second: tuple[int, str] = (-1, "")
+
+
+def utc_now() -> str:
+    """Return the current UTC time as an ISO 8601 string, e.g.
+    2025-01-01T00:00:00.000000+00:00 — the format every timestamp column uses.
+
+    Formats the date/time part once per second and only appends microseconds
+    otherwise; about twice as fast as datetime.now(timezone.utc).isoformat().
+    Unlike isoformat(), the microseconds are always present, so values
+    compare correctly as strings.
+    """
+    global _now_second
+    second, micros = divmod(time.time_ns() // 1000, 1_000_000)
+    cached_second, prefix = _now_second
+    if cached_second != second:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _now_second = (second, prefix)
+    return f"{prefix}.{micros:06d}+00:00"
+
+
+class _ThreadConnection:
+    """A thread's cached connection (sqlite3.Connection is not weak-referenceable).
+
+    The connection is closed when the holder is, or when the holder is garbage
+    collected after its thread exits. `in_use` is held while the owner uses it.
+    """
+
+    __slots__ = ("conn", "key", "in_use", "close", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection, key: tuple[int, str]) -> None:
+        self.conn = conn
+        self.key = key
+        self.in_use = threading.Lock()
+        self.close = weakref.finalize(self, conn.close)
+
+
+_local = threading.local()
+# Bumped by close_thread_connections(). A thread whose connection predates the
+# current generation (or DB_PATH) replaces it on its next thread_connection().
+_thread_generation = 0
+# Every open per-thread connection. Holders drop out when their thread exits.
+_thread_connections: "weakref.WeakSet[_ThreadConnection]" = weakref.WeakSet()
+_thread_connections_lock = threading.Lock()
+
+
+def _close_thread_connection(holder: _ThreadConnection) -> None:
+    with _thread_connections_lock:
+        _thread_connections.discard(holder)
+    holder.close()
+
+
+@contextmanager
+def thread_connection() -> Generator[sqlite3.Connection, None, None]:
+    """Use the calling thread's long-lived connection for the enclosed block.
+
+    Reusing one connection per worker thread keeps its page cache and statement
+    cache warm across runs and skips the connect + PRAGMA cost. Callers must NOT
+    close it. Uncommitted work is rolled back on return; a connection retired
+    by close_thread_connections() while in use is closed here.
+    """
+    while True:
+        key = (_thread_generation, str(DB_PATH))
+        holder = getattr(_local, "holder", None)
+        if holder is not None and holder.key != key:
+            _local.holder = None
+            _close_thread_connection(holder)
+            holder = None
+        if holder is None:
+            holder = _ThreadConnection(get_connection(), key)
+            with _thread_connections_lock:
+                _thread_connections.add(holder)
+            _local.holder = holder
+        with _thread_connections_lock:
+            # Never blocks: only close_thread_connections() takes another
+            # thread's lock, and it does so under _thread_connections_lock.
+            registered = holder in _thread_connections
+            if registered:
+                holder.in_use.acquire()
+        if registered:
+            break
+        _local.holder = None  # closed while idle; open a fresh one
+    try:
+        yield holder.conn
+    finally:
+        try:
+            holder.conn.rollback()
+        finally:
+            holder.in_use.release()
+            if holder.key != (_thread_generation, str(DB_PATH)):
+                _local.holder = None
+                _close_thread_connection(holder)
+
+
+def close_thread_connections() -> None:
+    """Close every per-thread connection (e.g. before deleting the DB file).
+
+    Idle connections are closed here, whichever thread owns them. One that is
+    in use is never closed from another thread, since that could pull the
+    handle out from under a running query; its owner closes it when its
+    thread_connection() block ends. Either way the owner opens a fresh
+    connection on its next thread_connection() call.
+    """
+    global _thread_generation
+    _thread_generation += 1
+    with _thread_connections_lock:
+        idle = [holder for holder in _thread_connections if holder.in_use.acquire(blocking=False)]
+        for holder in idle:
+            _thread_connections.discard(holder)
+    for holder in idle:
+        holder.close()
+
+
+def fetchall_dicts(cursor: sqlite3.Cursor) -> list[dict]:
+    """Fetch the cursor's remaining rows as plain dicts.
+
+    For list endpoints that hand rows straight to the response: zipping the
+    column names onto raw tuples skips building a sqlite3.Row per row, about
+    20% faster than [dict(row) for row in cursor].
+    """
+    cursor.row_factory = None
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+# Upper bound on connections checked out of the request pool at once.
+POOL_SIZE = 8
+
+# Idle pooled connections as (db_path, conn). LIFO so the most recently used,
+# cache-warm connection is handed out next.
+_pool: "queue.LifoQueue[tuple[str, sqlite3.Connection]]" = queue.LifoQueue()
+_pool_slots = threading.BoundedSemaphore(POOL_SIZE)
+
+
+class PoolTimeout(TimeoutError):
+    """No pooled connection became free within the checkout timeout."""
+
+
+def warm_connection_pool() -> None:
+    """Pre-open the pool's connections so the first requests skip connect + PRAGMAs."""
+    db_path = str(DB_PATH)
+    for _ in range(POOL_SIZE - _pool.qsize()):
+        _pool.put((db_path, get_connection()))
+
+
+@contextmanager
+def pooled_connection(timeout: float = 30) -> Generator[sqlite3.Connection, None, None]:
+    """Check a connection out of the process-wide pool for the enclosed block.
+
+    Unlike thread_connection(), the connection belongs to the caller for
+    the whole block, whichever threads that block runs on. Blocks until one of
+    the POOL_SIZE connections is free; raises PoolTimeout (a TimeoutError
+    subclass) after `timeout` seconds. Uncommitted work is rolled back on return.
+    """
+    if not _pool_slots.acquire(timeout=timeout):
+        raise PoolTimeout(f"No pooled database connection free after {timeout}s")
+    try:
+        db_path = str(DB_PATH)
+        try:
+            conn_path, conn = _pool.get_nowait()
+        except queue.Empty:
+            conn_path, conn = db_path, get_connection()
+        if conn_path != db_path:
+            conn.close()
+            conn = get_connection()
+        try:
+            yield conn
+        finally:
+            try:
+                conn.rollback()
+            except sqlite3.ProgrammingError:
+                pass  # closed by the caller; drop it
+            else:
+                _pool.put((db_path, conn))
+    finally:
+        _pool_slots.release()
+
+
+def close_pooled_connections() -> None:
+    """Close every idle pooled connection; checked-out ones are replaced on later checkout."""
+    while True:
+        try:
+            _, conn = _pool.get_nowait()
+        except queue.Empty:
+            return
+        conn.close()
+
+
+def close_cached_connections() -> None:
+    """Retire per-thread connections and close idle pooled ones (e.g. before deleting the DB file)."""
+    close_thread_connections()
+    close_pooled_connections()
+
+
+@contextmanager
+def write_transaction(conn: sqlite3.Connection) -> Generator[sqlite3.Connection, None, None]:
+    """Run the enclosed writes as one BEGIN IMMEDIATE ... COMMIT (one WAL commit).
+
+    Takes the write lock up front so the block cannot fail mid-way on a
+    read->write lock upgrade. Rolls back on any exception. Writes already
+    pending on the connection become part of the same transaction.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+# INSERT ... RETURNING (used by executor.create_steps) needs SQLite 3.35+.
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+
 def init_db() -> None:
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(
+            f"SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))}+ is required, "
+            f"found {sqlite3.sqlite_version}"
+        )
     conn = get_connection()
     try:
         conn.executescript("""
@@ -61,6 +311,18 @@ def init_db() -> None:
                 created_at TEXT NOT NULL,
                 updated_at TEXT NOT NULL
             );
+
+            CREATE INDEX IF NOT EXISTS idx_steps_run_id ON steps(run_id, step_index);
+            -- A run has one row per workflow step; retries update that row in place
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_steps_run_step ON steps(run_id, step_id);
+            CREATE INDEX IF NOT EXISTS idx_step_results_step_id ON step_results(step_id);
+            CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status) WHERE status = 'running';
+            -- Recovery's scan; like idx_runs_status it covers active runs only
+            CREATE INDEX IF NOT EXISTS idx_runs_active ON runs(status)
+                WHERE status IN ('pending', 'running');
+            CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at DESC);
+
+            ANALYZE;
         """)
     finally:
         conn.close()
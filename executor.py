@@ -1,21 +1,47 @@
+import functools
 import json
 import logging
+import os
 import sqlite3
 import threading
 import uuid
 from collections import deque
-from datetime import datetime, timezone
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from pydantic import TypeAdapter
 
 from actions import dispatch_action
-from models import WorkflowStepConfig
+from database import fetchall_dicts, utc_now as _now, write_transaction
+from models import WorkflowStep, WorkflowStepConfig
 from tasks import TaskExecutionError, execute_task
 
 logger = logging.getLogger(__name__)
 
 
-def _now() -> str:
-    """Return the current UTC time as an ISO 8601 string."""
-    return datetime.now(timezone.utc).isoformat()
+def _uuid4_batch(count: int) -> list[str]:
+    """Return `count` random UUID4 strings from a single os.urandom call."""
+    raw = os.urandom(16 * count)
+    return [str(uuid.UUID(bytes=raw[i:i + 16], version=4)) for i in range(0, 16 * count, 16)]
+
+
+def _checked_fields(kwargs: dict, allowed: set[str]) -> tuple[str, ...]:
+    """Return the kwarg names in canonical (sorted) order, rejecting unknown ones."""
+    for field in kwargs:
+        if field not in allowed:
+            raise ValueError(f"Unknown field: {field}")
+    return tuple(sorted(kwargs))
+
+
+@functools.lru_cache(maxsize=64)
+def _update_sql(table: str, fields: tuple[str, ...]) -> str:
+    """Build the status UPDATE for one set of optional columns, once.
+
+    Identical SQL text for identical column sets (regardless of kwarg order)
+    lets sqlite3's statement cache reuse the prepared statement.
+    """
+    set_clause = ", ".join(["status = ?", *(f"{field} = ?" for field in fields)])
+    return f"UPDATE {table} SET {set_clause} WHERE id = ?"
 
 
 # ---------------------------------------------------------------------------
@@ -35,11 +61,11 @@ def create_workflow(conn: sqlite3.Connection, name: str, definition_json: str) -
     return workflow_id
 
 
-def get_all_workflows(conn: sqlite3.Connection) -> list[sqlite3.Row]:
-    """Return all workflows (summary: no definition). Newest first."""
-    return conn.execute(
+def get_all_workflows(conn: sqlite3.Connection) -> list[dict]:
+    """Return all workflows as dicts (summary: no definition). Newest first."""
+    return fetchall_dicts(conn.execute(
         "SELECT id, name, created_at FROM workflows ORDER BY created_at DESC"
-    ).fetchall()
+    ))
 
 
 def get_workflow(conn: sqlite3.Connection, workflow_id: str) -> sqlite3.Row | None:
@@ -55,8 +81,8 @@ def get_workflow(conn: sqlite3.Connection, workflow_id: str) -> sqlite3.Row | No
 # ---------------------------------------------------------------------------
 
 
-def create_run(conn: sqlite3.Connection, workflow_id: str, order_id: str | None = None) -> str:
-    """Insert a new run in 'pending' status. Commits. Returns the run UUID."""
+def insert_run(conn: sqlite3.Connection, workflow_id: str, order_id: str | None = None) -> str:
+    """Insert a new run in 'pending' status. Does NOT commit. Returns the run UUID."""
     run_id = str(uuid.uuid4())
     now = _now()
     conn.execute(
@@ -64,18 +90,33 @@ def create_run(conn: sqlite3.Connection, workflow_id: str, order_id: str | None
         "VALUES (?, ?, 'pending', NULL, NULL, ?, ?)",
         (run_id, workflow_id, now, order_id),
     )
+    return run_id
+
+
+def create_run(conn: sqlite3.Connection, workflow_id: str, order_id: str | None = None) -> str:
+    """Insert a new run in 'pending' status. Commits. Returns the run UUID."""
+    run_id = insert_run(conn, workflow_id, order_id=order_id)
     conn.commit()
     return run_id
 
 
-def get_all_runs(conn: sqlite3.Connection) -> list[sqlite3.Row]:
-    """Return all runs with workflow_name (via JOIN). Newest first."""
-    return conn.execute(
+def get_active_run_id(conn: sqlite3.Connection, order_id: str) -> str | None:
+    """Return the ID of the order's pending or running run, or None."""
+    row = conn.execute(
+        "SELECT id FROM runs WHERE order_id = ? AND status IN ('pending', 'running')",
+        (order_id,),
+    ).fetchone()
+    return row["id"] if row else None
+
+
+def get_all_runs(conn: sqlite3.Connection) -> list[dict]:
+    """Return all runs as dicts, with workflow_name (via JOIN). Newest first."""
+    return fetchall_dicts(conn.execute(
         "SELECT r.id, r.workflow_id, w.name AS workflow_name, r.order_id, r.status, "
         "r.started_at, r.completed_at "
         "FROM runs r JOIN workflows w ON r.workflow_id = w.id "
         "ORDER BY r.created_at DESC"
-    ).fetchall()
+    ))
 
 
 def get_run_detail(conn: sqlite3.Connection, run_id: str) -> sqlite3.Row | None:
@@ -89,28 +130,49 @@ def get_run_detail(conn: sqlite3.Connection, run_id: str) -> sqlite3.Row | None:
     ).fetchone()
 
 
+def get_run_with_definition(conn: sqlite3.Connection, run_id: str) -> sqlite3.Row | None:
+    """Return get_run_detail's columns plus the workflow `definition`, or None.
+
+    One query gives execute_run everything it needs to start a run.
+    """
+    return conn.execute(
+        "SELECT r.id, r.workflow_id, w.name AS workflow_name, r.order_id, r.status, "
+        "r.started_at, r.completed_at, w.definition "
+        "FROM runs r JOIN workflows w ON r.workflow_id = w.id "
+        "WHERE r.id = ?",
+        (run_id,),
+    ).fetchone()
+
+
 def get_running_runs(conn: sqlite3.Connection) -> list[sqlite3.Row]:
-    """Return all runs with status='running' (for crash recovery)."""
-    return conn.execute("SELECT * FROM runs WHERE status = 'running'").fetchall()
+    """Return the IDs of all runs with status='running' (rows with just `id`)."""
+    return conn.execute("SELECT id FROM runs WHERE status = 'running'").fetchall()
 
 
-def update_run_status(conn: sqlite3.Connection, run_id: str, status: str, **kwargs) -> None:
-    """Update a run's status and optional fields. Does NOT commit."""
-    allowed = {"started_at", "completed_at"}
+def get_resumable_runs_with_definitions(conn: sqlite3.Connection) -> list[sqlite3.Row]:
+    """Return runs to resume after a restart, joined with workflow name and definition.
 
-    set_clauses = ["status = ?"]
-    params: list = [status]
+    That is every 'running' run, plus 'pending' runs that already have their
+    step rows (queued on the worker pool but never started). Same columns as
+    get_run_detail plus `definition`, so recovery can hand each run to
+    execute_run without a per-run re-read.
+    """
+    return conn.execute(
+        "SELECT r.id, r.workflow_id, w.name AS workflow_name, r.order_id, r.status, "
+        "r.started_at, r.completed_at, w.definition "
+        "FROM runs r JOIN workflows w ON r.workflow_id = w.id "
+        "WHERE r.status IN ('pending', 'running') "
+        "AND (r.status = 'running' OR EXISTS (SELECT 1 FROM steps s WHERE s.run_id = r.id)) "
+        "ORDER BY r.created_at"
+    ).fetchall()
 
-    for field, value in kwargs.items():
-        if field not in allowed:
-            raise ValueError(f"Unknown field: {field}")
-        set_clauses.append(f"{field} = ?")
-        params.append(value)
 
-    params.append(run_id)
+def update_run_status(conn: sqlite3.Connection, run_id: str, status: str, **kwargs) -> None:
+    """Update a run's status and optional fields. Does NOT commit."""
+    fields = _checked_fields(kwargs, {"started_at", "completed_at"})
     conn.execute(
-        f"UPDATE runs SET {', '.join(set_clauses)} WHERE id = ?",
-        params,
+        _update_sql("runs", fields),
+        [status, *(kwargs[field] for field in fields), run_id],
     )
 
 
@@ -119,60 +181,124 @@ def update_run_status(conn: sqlite3.Connection, run_id: str, status: str, **kwar
 # ---------------------------------------------------------------------------
 
 
-def create_steps(conn: sqlite3.Connection, run_id: str, steps_definition: list) -> list[sqlite3.Row]:
-    """Create step rows from workflow step definitions. Commits.
+# Rows per multi-row INSERT in create_steps: 6 bound parameters each keeps a
+# statement under SQLite's historical 999-variable limit.
+_STEP_INSERT_BATCH = 150
+
+
+@functools.lru_cache(maxsize=32)
+def _insert_steps_sql(rows: int) -> str:
+    """Build the multi-row steps INSERT ... RETURNING for `rows` rows, once per size."""
+    values = ", ".join(["(?, ?, ?, ?, 'pending', NULL, 0, ?, NULL, NULL, NULL, ?)"] * rows)
+    return (
+        "INSERT INTO steps "
+        "(id, run_id, step_id, step_index, status, idempotency_key, "
+        "retry_count, max_retries, started_at, completed_at, error_message, created_at) "
+        f"VALUES {values} RETURNING *"
+    )
+
+
+def insert_steps(conn: sqlite3.Connection, run_id: str, steps_definition: Sequence) -> list[sqlite3.Row]:
+    """Insert step rows from workflow step definitions. Does NOT commit.
 
-    steps_definition: list of objects with .id and .config.max_retries attributes
+    steps_definition: objects with .id and .config.max_retries attributes
     (e.g. WorkflowStep Pydantic models).
 
     Returns the created step rows ordered by step_index.
     """
     now = _now()
     sorted_steps = topological_sort(steps_definition)
-    for index, step in enumerate(sorted_steps):
-        step_uuid = str(uuid.uuid4())
-        conn.execute(
-            "INSERT INTO steps "
-            "(id, run_id, step_id, step_index, status, idempotency_key, "
-            "retry_count, max_retries, started_at, completed_at, error_message, created_at) "
-            "VALUES (?, ?, ?, ?, 'pending', NULL, 0, ?, NULL, NULL, NULL, ?)",
-            (step_uuid, run_id, step.id, index, step.config.max_retries, now),
-        )
-    conn.commit()
+    step_uuids = _uuid4_batch(len(sorted_steps))
+    params = [
+        (step_uuids[index], run_id, step.id, index, step.config.max_retries, now)
+        for index, step in enumerate(sorted_steps)
+    ]
+    created: list[sqlite3.Row] = []
+    # Multi-row INSERT ... RETURNING hands back the new rows directly,
+    # replacing the follow-up SELECT (executemany cannot return rows).
+    for start in range(0, len(params), _STEP_INSERT_BATCH):
+        batch = params[start:start + _STEP_INSERT_BATCH]
+        created.extend(conn.execute(
+            _insert_steps_sql(len(batch)),
+            [value for row in batch for value in row],
+        ).fetchall())
+    # RETURNING row order is unspecified
+    created.sort(key=lambda row: row["step_index"])
+    return created
+
+
+def create_steps(conn: sqlite3.Connection, run_id: str, steps_definition: Sequence) -> list[sqlite3.Row]:
+    """Like insert_steps, but all rows are written in one transaction. Commits."""
+    with write_transaction(conn):
+        return insert_steps(conn, run_id, steps_definition)
+
+
+def get_steps_for_run(conn: sqlite3.Connection, run_id: str) -> list[sqlite3.Row]:
+    """Return all steps for a run, ordered by step_index."""
     return conn.execute(
         "SELECT * FROM steps WHERE run_id = ? ORDER BY step_index",
         (run_id,),
     ).fetchall()
 
 
-def get_steps_for_run(conn: sqlite3.Connection, run_id: str) -> list[sqlite3.Row]:
-    """Return all steps for a run, ordered by step_index."""
+def get_step_by_id(conn: sqlite3.Connection, step_id: str) -> sqlite3.Row | None:
+    """Return a single step row by its UUID, or None."""
     return conn.execute(
-        "SELECT * FROM steps WHERE run_id = ? ORDER BY step_index",
+        "SELECT * FROM steps WHERE id = ?",
+        (step_id,),
+    ).fetchone()
+
+
+# Exactly the StepStateResponse fields, in model order.
+_STEP_STATE_COLUMNS = (
+    "id, step_id, step_index, status, retry_count, max_retries, "
+    "started_at, completed_at, error_message"
+)
+_STEP_STATES_SQL = f"SELECT {_STEP_STATE_COLUMNS} FROM steps WHERE run_id = ? ORDER BY step_index"
+
+
+def get_step_states_for_run(conn: sqlite3.Connection, run_id: str) -> list[sqlite3.Row]:
+    """Return a run's steps ordered by step_index, projected to the API's step fields."""
+    return conn.execute(
+        _STEP_STATES_SQL,
+        (run_id,),
+    ).fetchall()
+
+
+# The step columns execute_run / execute_step read; skips timestamps and the
+# (possibly long) error_message.
+_EXECUTION_STEP_COLUMNS = "id, step_id, step_index, status, retry_count, max_retries, idempotency_key"
+_EXECUTION_STEPS_SQL = f"SELECT {_EXECUTION_STEP_COLUMNS} FROM steps WHERE run_id = ? ORDER BY step_index"
+_EXECUTION_STEP_SQL = f"SELECT {_EXECUTION_STEP_COLUMNS} FROM steps WHERE id = ?"
+
+
+def get_steps_for_execution(conn: sqlite3.Connection, run_id: str) -> list[sqlite3.Row]:
+    """Return a run's steps ordered by step_index, projected to _EXECUTION_STEP_COLUMNS."""
+    return conn.execute(
+        _EXECUTION_STEPS_SQL,
         (run_id,),
     ).fetchall()
 
 
+def get_step_for_execution(conn: sqlite3.Connection, step_id: str) -> sqlite3.Row | None:
+    """Return one step projected to _EXECUTION_STEP_COLUMNS, or None."""
+    return conn.execute(
+        _EXECUTION_STEP_SQL,
+        (step_id,),
+    ).fetchone()
+
+
 def update_step_status(conn: sqlite3.Connection, step_id: str, status: str, **kwargs) -> None:
     """Update a step's status and optional fields. Does NOT commit.
 
     Allowed kwargs: started_at, completed_at, error_message, idempotency_key, retry_count
     """
-    allowed = {"started_at", "completed_at", "error_message", "idempotency_key", "retry_count"}
-
-    set_clauses = ["status = ?"]
-    params: list = [status]
-
-    for field, value in kwargs.items():
-        if field not in allowed:
-            raise ValueError(f"Unknown field: {field}")
-        set_clauses.append(f"{field} = ?")
-        params.append(value)
-
-    params.append(step_id)
+    fields = _checked_fields(
+        kwargs, {"started_at", "completed_at", "error_message", "idempotency_key", "retry_count"},
+    )
     conn.execute(
-        f"UPDATE steps SET {', '.join(set_clauses)} WHERE id = ?",
-        params,
+        _update_sql("steps", fields),
+        [status, *(kwargs[field] for field in fields), step_id],
     )
 
 
@@ -204,6 +330,14 @@ def check_step_result(conn: sqlite3.Connection, idempotency_key: str) -> sqlite3
     ).fetchone()
 
 
+def step_result_exists(conn: sqlite3.Connection, idempotency_key: str) -> bool:
+    """Like check_step_result, but only reports presence (answered from the key index)."""
+    return conn.execute(
+        "SELECT 1 FROM step_results WHERE idempotency_key = ?",
+        (idempotency_key,),
+    ).fetchone() is not None
+
+
 # ---------------------------------------------------------------------------
 # Step Ordering (Dependency Graph)
 # ---------------------------------------------------------------------------
@@ -221,42 +355,33 @@ def topological_sort(steps: list) -> list:
     steps: list of objects with .id (str) and .depends_on (list[str]).
     Returns: new list in topologically sorted order.
     """
-    id_to_step = {}
-    in_degree = {}
-    dependents: dict[str, list[str]] = {}
-    original_index = {}
+    # Work on positions 0..N-1 so the BFS loop only touches lists of ints.
+    index_of = {step.id: idx for idx, step in enumerate(steps)}
+    in_degree = [len(step.depends_on) for step in steps]
+    dependents: list[list[int]] = [[] for _ in steps]
 
+    # Filled in original order, so each dependents list is already ascending
+    # by original index — newly-ready steps come out stable without sorting.
     for idx, step in enumerate(steps):
-        id_to_step[step.id] = step
-        in_degree[step.id] = len(step.depends_on)
-        dependents[step.id] = []
-        original_index[step.id] = idx
-
-    for step in steps:
         for dep in step.depends_on:
-            dependents[dep].append(step.id)
+            dependents[index_of[dep]].append(idx)
 
     # Seed queue with zero-dependency steps in original order
-    queue = deque(step.id for step in steps if in_degree[step.id] == 0)
+    queue = deque(idx for idx, degree in enumerate(in_degree) if degree == 0)
 
-    result: list = []
+    order: list[int] = []
     while queue:
-        step_id = queue.popleft()
-        result.append(id_to_step[step_id])
-
-        # Collect newly-ready dependents, sort by original index for stability
-        newly_ready = []
-        for dependent_id in dependents[step_id]:
-            in_degree[dependent_id] -= 1
-            if in_degree[dependent_id] == 0:
-                newly_ready.append(dependent_id)
-        newly_ready.sort(key=lambda sid: original_index[sid])
-        queue.extend(newly_ready)
-
-    if len(result) != len(steps):
+        idx = queue.popleft()
+        order.append(idx)
+        for dependent in dependents[idx]:
+            in_degree[dependent] -= 1
+            if in_degree[dependent] == 0:
+                queue.append(dependent)
+
+    if len(order) != len(steps):
         raise ValueError("Circular dependency detected among workflow steps")
 
-    return result
+    return [steps[idx] for idx in order]
 
 
 # ---------------------------------------------------------------------------
@@ -290,6 +415,42 @@ def get_order(conn: sqlite3.Connection, order_id: str) -> sqlite3.Row | None:
 # ---------------------------------------------------------------------------
 
 
+@functools.lru_cache(maxsize=256)
+def parse_definition(workflow_id: str, definition_json: str) -> dict:
+    """Return the parsed workflow definition. Cached; callers must not mutate it.
+
+    Definitions are immutable after creation, so runs (and recoveries) of the
+    same workflow share one parse. The definition text is part of the cache
+    key, so a different definition never hits a stale entry.
+    """
+    return json.loads(definition_json)
+
+
+_WORKFLOW_STEPS_ADAPTER = TypeAdapter(list[WorkflowStep])
+
+
+@functools.lru_cache(maxsize=256)
+def parse_steps(workflow_id: str, definition_json: str) -> tuple[WorkflowStep, ...]:
+    """Return a workflow's validated steps. Cached; callers must not mutate them.
+
+    The whole list is validated in one pydantic-core call, once per definition.
+    """
+    definition = parse_definition(workflow_id, definition_json)
+    return tuple(_WORKFLOW_STEPS_ADAPTER.validate_python(definition["steps"]))
+
+
+@functools.lru_cache(maxsize=256)
+def _step_configs(workflow_id: str, definition_json: str) -> dict[str, WorkflowStepConfig]:
+    """Return validated step configs for a workflow, keyed by step ID. Cached."""
+    return {step.id: step.config for step in parse_steps(workflow_id, definition_json)}
+
+
+@functools.lru_cache(maxsize=256)
+def _step_dependencies(workflow_id: str, definition_json: str) -> dict[str, frozenset[str]]:
+    """Return each step's depends_on as a set, keyed by step ID. Cached."""
+    return {step.id: frozenset(step.depends_on) for step in parse_steps(workflow_id, definition_json)}
+
+
 def execute_step(
     conn: sqlite3.Connection,
     step_row: sqlite3.Row,
@@ -298,27 +459,35 @@ def execute_step(
 ) -> str:
     """Execute a single step with idempotency and retry support.
 
+    Every state transition is a single write transaction: at most two commits
+    per attempt (running, then completed/pending/failed), one on the
+    crash-recovery skip path.
+
     Returns "completed", "retry", or "failed".
     """
     step_id = step_row["id"]
     retry_count = step_row["retry_count"]
     max_retries = step_row["max_retries"]
 
-    # 1. Reuse existing idempotency key (crash recovery) or generate a new one
-    idem_key = step_row["idempotency_key"] or str(uuid.uuid4())
-    update_step_status(
-        conn, step_id, "running",
-        idempotency_key=idem_key, started_at=_now(),
-    )
-    conn.commit()
+    # 1. Check for existing result (idempotency — crash recovery case). Only a
+    #    reused key can have a result, so fresh steps skip the lookup entirely.
+    if step_row["idempotency_key"] is not None:
+        if step_result_exists(conn, step_row["idempotency_key"]):
+            logger.info(
+                "Step %s: found existing result for idem key %s, skipping",
+                step_id, step_row["idempotency_key"],
+            )
+            with write_transaction(conn):
+                update_step_status(conn, step_id, "completed", completed_at=_now())
+            return "completed"
 
-    # 2. Check for existing result (idempotency — crash recovery case)
-    existing = check_step_result(conn, idem_key)
-    if existing is not None:
-        logger.info("Step %s: found existing result for idem key %s, skipping", step_id, idem_key)
-        update_step_status(conn, step_id, "completed", completed_at=_now())
-        conn.commit()
-        return "completed"
+    # 2. Reuse existing idempotency key (crash recovery) or generate a new one
+    idem_key = step_row["idempotency_key"] or str(uuid.uuid4())
+    with write_transaction(conn):
+        update_step_status(
+            conn, step_id, "running",
+            idempotency_key=idem_key, started_at=_now(),
+        )
 
     # 3. Execute the task
     try:
@@ -327,11 +496,11 @@ def execute_step(
         if retry_count < max_retries:
             # Retry: increment count, new idem key, back to pending
             new_idem_key = str(uuid.uuid4())
-            update_step_status(
-                conn, step_id, "pending",
-                retry_count=retry_count + 1, idempotency_key=new_idem_key,
-            )
-            conn.commit()
+            with write_transaction(conn):
+                update_step_status(
+                    conn, step_id, "pending",
+                    retry_count=retry_count + 1, idempotency_key=new_idem_key,
+                )
             logger.info(
                 "Step %s: attempt %d/%d failed, will retry",
                 step_id, retry_count + 1, max_retries + 1,
@@ -339,38 +508,37 @@ def execute_step(
             return "retry"
         else:
             # Exhausted: mark failed
-            update_step_status(
-                conn, step_id, "failed",
-                completed_at=_now(), error_message=str(e),
-            )
-            conn.commit()
+            with write_transaction(conn):
+                update_step_status(
+                    conn, step_id, "failed",
+                    completed_at=_now(), error_message=str(e),
+                )
             logger.warning("Step %s: permanently failed after %d attempts", step_id, retry_count + 1)
             return "failed"
 
     # 4. Success: atomic commit — insert result + mark completed + dispatch action
     try:
-        insert_step_result(conn, idem_key, step_id, result)
-        dispatch_action(conn, step_config.action, order_id)
-        update_step_status(conn, step_id, "completed", completed_at=_now())
-        conn.commit()
+        with write_transaction(conn):
+            insert_step_result(conn, idem_key, step_id, result)
+            dispatch_action(conn, step_config.action, order_id)
+            update_step_status(conn, step_id, "completed", completed_at=_now())
     except Exception:
-        conn.rollback()
-        # Action failure treated as step failure
+        # Rolled back by write_transaction. Action failure treated as step failure
         if retry_count < max_retries:
             new_idem_key = str(uuid.uuid4())
-            update_step_status(
-                conn, step_id, "pending",
-                retry_count=retry_count + 1, idempotency_key=new_idem_key,
-            )
-            conn.commit()
+            with write_transaction(conn):
+                update_step_status(
+                    conn, step_id, "pending",
+                    retry_count=retry_count + 1, idempotency_key=new_idem_key,
+                )
             logger.info("Step %s: action dispatch failed, will retry", step_id)
             return "retry"
         else:
-            update_step_status(
-                conn, step_id, "failed",
-                completed_at=_now(), error_message="Action dispatch failed",
-            )
-            conn.commit()
+            with write_transaction(conn):
+                update_step_status(
+                    conn, step_id, "failed",
+                    completed_at=_now(), error_message="Action dispatch failed",
+                )
             logger.warning("Step %s: action dispatch permanently failed", step_id)
             return "failed"
 
@@ -378,99 +546,238 @@ def execute_step(
     return "completed"
 
 
-def execute_run(run_id: str) -> None:
-    """Execute all steps in a run sequentially. Designed for background threads.
+def _run_step(
+    conn: sqlite3.Connection,
+    run_id: str,
+    step_row: sqlite3.Row,
+    step_config: WorkflowStepConfig,
+    order_id: str | None,
+) -> bool:
+    """Execute one step through all of its attempts. Returns True if it completed."""
+    try:
+        # step_row is current for the first attempt: nothing else writes this
+        # step between the run's step read and its first attempt
+        current = step_row
+        while True:
+            outcome = execute_step(conn, current, step_config, order_id=order_id)
+            if outcome == "completed":
+                return True
+            if outcome == "failed":
+                return False
+            # Retry: re-fetch for the incremented retry_count and new idempotency key
+            current = get_step_for_execution(conn, step_row["id"])
+    except Exception:
+        logger.exception(
+            "Run %s: unexpected error executing step '%s' (index=%d, id=%s)",
+            run_id, step_row["step_id"], step_row["step_index"], step_row["id"],
+        )
+        raise
 
-    Opens its own DB connection for thread safety.
-    """
-    from database import get_connection
 
-    conn = get_connection()
-    try:
-        # Load run and workflow definition
-        run = get_run_detail(conn, run_id)
-        if run is None:
-            logger.error("Run %s not found", run_id)
-            return
-
-        workflow = get_workflow(conn, run["workflow_id"])
-        if workflow is None:
-            logger.error("Workflow %s not found for run %s", run["workflow_id"], run_id)
-            return
-
-        definition = json.loads(workflow["definition"])
-        step_configs_by_id = {s["id"]: s["config"] for s in definition["steps"]}
-        order_id = run["order_id"]
-        logger.info("Run %s: starting execution (workflow='%s', steps=%d, order_id=%s)",
-                     run_id, run["workflow_name"], len(step_configs_by_id), order_id)
-
-        # Mark run as running (skip if already running — crash recovery case)
-        if run["status"] != "running":
-            update_run_status(conn, run_id, "running", started_at=_now())
-            conn.commit()
+def _run_branch_step(
+    run_id: str,
+    step_row: sqlite3.Row,
+    step_config: WorkflowStepConfig,
+    order_id: str | None,
+) -> bool:
+    """_run_step on a branch pool thread, using that thread's cached connection."""
+    from database import thread_connection
 
-        # Process steps sequentially
-        steps = get_steps_for_run(conn, run_id)
-        run_failed = False
+    with thread_connection() as conn:
+        return _run_step(conn, run_id, step_row, step_config, order_id)
 
-        for step_row in steps:
-            # Skip completed steps (crash recovery)
-            if step_row["status"] == "completed":
-                logger.info("Step %s (%s): already completed, skipping", step_row["id"], step_row["step_id"])
-                continue
 
-            # Build config from workflow definition (lookup by step ID, not array position)
-            config_dict = step_configs_by_id[step_row["step_id"]]
-            step_config = WorkflowStepConfig(**config_dict)
+# Upper bound on steps of one run executing at once. Concurrent steps run on
+# the shared branch pool (see BRANCH_POOL_MAX_WORKERS), not the run's worker.
+MAX_PARALLEL_STEPS = 8
 
-            # Retry loop for this step
-            try:
-                while True:
-                    # Re-fetch step to get current retry_count (may have been incremented)
-                    current_step = get_steps_for_run(conn, run_id)
-                    current = next(s for s in current_step if s["id"] == step_row["id"])
 
-                    outcome = execute_step(conn, current, step_config, order_id=order_id)
+def execute_run(
+    run_id: str,
+    prefetched: sqlite3.Row | None = None,
+    stop: threading.Event | None = None,
+) -> None:
+    """Execute a run's steps in dependency order. Designed for background threads.
 
-                    if outcome == "completed":
-                        break
-                    elif outcome == "retry":
-                        continue
-                    else:  # "failed"
-                        run_failed = True
-                        break
-            except Exception:
-                logger.exception(
-                    "Run %s: unexpected error executing step '%s' (index=%d, id=%s)",
-                    run_id, step_row["step_id"], step_row["step_index"], step_row["id"],
-                )
-                raise
+    A step starts once every step it depends on has completed. While only one
+    step is ready it runs on the calling thread; independent steps that are
+    ready together run concurrently on branch threads (at most
+    MAX_PARALLEL_STEPS). After a step fails no new steps start: steps already
+    executing finish, and the rest stay pending.
 
-            if run_failed:
-                break
+    prefetched: optional row from get_resumable_runs_with_definitions; when
+    given, the run is not re-read. Otherwise the run and its workflow
+    definition come from one get_run_with_definition query.
 
-        # Set final run status
-        final_status = "failed" if run_failed else "completed"
-        update_run_status(conn, run_id, final_status, completed_at=_now())
-        conn.commit()
-        logger.info("Run %s: finished with status '%s'", run_id, final_status)
+    stop: when set, no new steps start and the run returns once its executing
+    steps finish, leaving its state for crash recovery (see shutdown_run_pool).
 
-    except Exception:
-        logger.exception("Run %s: unexpected error during execution", run_id)
+    Uses the calling thread's cached DB connection (one connection per thread).
+    """
+    from database import thread_connection
+
+    with thread_connection() as conn:
         try:
-            update_run_status(conn, run_id, "failed", completed_at=_now())
-            conn.commit()
-        except Exception:
-            logger.exception("Run %s: failed to update run status after error", run_id)
-    finally:
-        conn.close()
+            # Load run and workflow definition
+            run = prefetched if prefetched is not None else get_run_with_definition(conn, run_id)
+            if run is None:
+                logger.error("Run %s not found", run_id)
+                return
+            definition_json = run["definition"]
+
+            step_configs_by_id = _step_configs(run["workflow_id"], definition_json)
+            dependencies = _step_dependencies(run["workflow_id"], definition_json)
+            order_id = run["order_id"]
+            logger.info("Run %s: starting execution (workflow='%s', steps=%d, order_id=%s)",
+                         run_id, run["workflow_name"], len(step_configs_by_id), order_id)
+
+            # Mark run as running (skip if already running — crash recovery case).
+            # Not committed here: the first step's transaction commits it together
+            # with that step's "running" transition (one commit, no window where the
+            # run is running but no step has started).
+            if run["status"] != "running":
+                update_run_status(conn, run_id, "running", started_at=_now())
+
+            completed: set[str] = set()
+            waiting = []  # not yet started, in step_index (topological) order
+            for step_row in get_steps_for_execution(conn, run_id):
+                # Skip completed steps (crash recovery)
+                if step_row["status"] == "completed":
+                    logger.info("Step %s (%s): already completed, skipping", step_row["id"], step_row["step_id"])
+                    completed.add(step_row["step_id"])
+                else:
+                    waiting.append(step_row)
+
+            executing: dict[Future, sqlite3.Row] = {}
+            run_failed = False
+            try:
+                while waiting or executing:
+                    ready = []
+                    if not run_failed and not (stop is not None and stop.is_set()):
+                        blocked = []
+                        for step_row in waiting:
+                            deps_done = completed >= dependencies[step_row["step_id"]]
+                            (ready if deps_done else blocked).append(step_row)
+                        waiting = blocked
+                    if not ready and not executing:
+                        break
 
+                    # A lone ready step runs inline, on this thread and connection
+                    if len(ready) == 1 and not executing:
+                        step_row = ready[0]
+                        if _run_step(conn, run_id, step_row, step_configs_by_id[step_row["step_id"]], order_id):
+                            completed.add(step_row["step_id"])
+                        else:
+                            run_failed = True
+                        continue
+
+                    # Commit the pending run status: branch connections cannot
+                    # write while this one holds the write lock
+                    conn.commit()
+                    for step_row in ready:
+                        future = _submit_branch_step(
+                            run_id, step_row, step_configs_by_id[step_row["step_id"]], order_id,
+                        )
+                        executing[future] = step_row
+                    done, _ = wait(executing, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        step_row = executing.pop(future)
+                        if future.result():
+                            completed.add(step_row["step_id"])
+                        else:
+                            run_failed = True
+            finally:
+                # Never finish the run while any of its steps is still executing
+                wait(executing)
+
+            if waiting and not run_failed:
+                # Leave the run as-is; recovery resumes it on the next start
+                logger.info("Run %s: worker pool shutting down, leaving run to recovery", run_id)
+                return
+
+            # Set final run status
+            final_status = "failed" if run_failed else "completed"
+            update_run_status(conn, run_id, final_status, completed_at=_now())
+            conn.commit()
+            logger.info("Run %s: finished with status '%s'", run_id, final_status)
 
-def start_run_thread(run_id: str) -> threading.Thread:
-    """Spawn a daemon thread to execute a run in the background."""
-    thread = threading.Thread(target=execute_run, args=(run_id,), daemon=True)
-    thread.start()
-    return thread
+        except Exception:
+            logger.exception("Run %s: unexpected error during execution", run_id)
+            try:
+                update_run_status(conn, run_id, "failed", completed_at=_now())
+                conn.commit()
+            except Exception:
+                logger.exception("Run %s: failed to update run status after error", run_id)
+
+
+# Runs spend most of their time sleeping in execute_task (the GIL is released
+# while they sleep), so the bounds are about capping threads and SQLite
+# connections, not CPU: sized so a burst of demo runs progresses together
+# instead of queueing behind a few multi-second steps. Executor threads (and
+# their cached connections) never exceed RUN_POOL_MAX_WORKERS +
+# BRANCH_POOL_MAX_WORKERS. Writers still serialize on write_transaction's
+# BEGIN IMMEDIATE.
+RUN_POOL_MAX_WORKERS = 32
+# Shared by every run's concurrent steps. Branch steps never wait on other
+# pool tasks, so a bounded pool cannot deadlock; extra ready steps queue.
+BRANCH_POOL_MAX_WORKERS = 16
+
+_run_pool: ThreadPoolExecutor | None = None
+_branch_pool: ThreadPoolExecutor | None = None
+# Set by shutdown_run_pool(); the pool's runs check it between steps.
+_run_pool_stopping = threading.Event()
+_run_pool_lock = threading.Lock()
+
+
+def _submit_branch_step(
+    run_id: str,
+    step_row: sqlite3.Row,
+    step_config: WorkflowStepConfig,
+    order_id: str | None,
+) -> Future:
+    """Queue one of a run's concurrent steps on the shared branch pool."""
+    global _branch_pool
+    with _run_pool_lock:
+        if _branch_pool is None:
+            _branch_pool = ThreadPoolExecutor(max_workers=BRANCH_POOL_MAX_WORKERS, thread_name_prefix="branch")
+        return _branch_pool.submit(_run_branch_step, run_id, step_row, step_config, order_id)
+
+
+def shutdown_run_pool(wait: bool = False) -> None:
+    """Stop the worker pool, by default without waiting for runs to finish (server shutdown).
+
+    Queued runs are cancelled and executing runs stop before their next step;
+    both are resumed by recover_interrupted_runs() on the next start. With
+    wait=True, returns once executing runs have stopped (e.g. before deleting
+    the DB file). A later submit_run() starts a fresh pool.
+
+    The branch pool is shut down after the runs, without cancelling: a run
+    waits for every step it has queued there.
+    """
+    global _run_pool, _branch_pool
+    with _run_pool_lock:
+        pool, _run_pool = _run_pool, None
+        _run_pool_stopping.set()
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+    with _run_pool_lock:
+        branch_pool, _branch_pool = _branch_pool, None
+    if branch_pool is not None:
+        branch_pool.shutdown(wait=wait)
+
+
+def submit_run(run_id: str, prefetched: sqlite3.Row | None = None) -> Future:
+    """Queue a run for background execution on the shared worker pool.
+
+    At most RUN_POOL_MAX_WORKERS runs execute at once (each worker keeps one
+    cached DB connection); further runs wait in the pool's queue.
+    """
+    global _run_pool, _run_pool_stopping
+    with _run_pool_lock:
+        if _run_pool is None:
+            _run_pool = ThreadPoolExecutor(max_workers=RUN_POOL_MAX_WORKERS, thread_name_prefix="run")
+            _run_pool_stopping = threading.Event()
+        return _run_pool.submit(execute_run, run_id, prefetched, _run_pool_stopping)
 
 
 # ---------------------------------------------------------------------------
@@ -478,27 +785,29 @@ def start_run_thread(run_id: str) -> threading.Thread:
 # ---------------------------------------------------------------------------
 
 
-def recover_interrupted_runs() -> list[threading.Thread]:
-    """Find all runs with status='running' and resume them in background threads.
+def recover_interrupted_runs() -> list[Future]:
+    """Find interrupted runs (see get_resumable_runs_with_definitions) and queue
+    them on the worker pool.
 
     Called at startup before accepting HTTP requests.
-    Returns list of spawned threads (useful for testing).
+    Returns one future per resumed run (useful for testing).
     """
     from database import get_connection
 
     conn = get_connection()
     try:
-        running = get_running_runs(conn)
+        # One JOIN for the whole sweep instead of a run + workflow read per run
+        running = get_resumable_runs_with_definitions(conn)
         if not running:
             logger.info("Recovery: no interrupted runs found")
             return []
 
         logger.info("Recovery: found %d interrupted run(s)", len(running))
-        threads = []
+        futures = []
         for run in running:
             run_id = run["id"]
             logger.info("Recovery: resuming run %s", run_id)
-            threads.append(start_run_thread(run_id))
-        return threads
+            futures.append(submit_run(run_id, prefetched=run))
+        return futures
     finally:
         conn.close()
@@ -1,27 +1,42 @@
+import functools
+import hashlib
 import json
 import logging
 import sqlite3
 from pathlib import Path
-from typing import Generator
+from typing import Any, Generator
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
-from database import get_connection, init_db
+from database import (
+    PoolTimeout,
+    close_cached_connections,
+    fetchall_dicts,
+    init_db,
+    pooled_connection,
+    warm_connection_pool,
+    write_transaction,
+)
 from executor import (
     create_order,
-    create_run,
-    create_steps,
     create_workflow,
+    get_active_run_id,
     get_all_runs,
     get_all_workflows,
     get_order,
     get_run_detail,
-    get_steps_for_run,
+    get_step_states_for_run,
     get_workflow,
+    insert_run,
+    insert_steps,
+    parse_definition,
+    parse_steps,
     recover_interrupted_runs,
-    start_run_thread,
+    shutdown_run_pool,
+    submit_run,
 )
 from models import (
     CreateOrderRequest,
@@ -30,9 +45,7 @@ from models import (
     RunDetailResponse,
     RunSummaryResponse,
     StartRunRequest,
-    StepStateResponse,
     WorkflowDetailResponse,
-    WorkflowStep,
     WorkflowSummaryResponse,
 )
 
@@ -52,20 +65,31 @@ app.add_middleware(
 @app.on_event("startup")
 def startup():
     init_db()
+    warm_connection_pool()
     recover_interrupted_runs()
 
 
+@app.on_event("shutdown")
+def shutdown():
+    shutdown_run_pool()
+    close_cached_connections()
+
+
 # ---------------------------------------------------------------------------
 # Dependencies
 # ---------------------------------------------------------------------------
 
 
 def get_db() -> Generator[sqlite3.Connection, None, None]:
-    conn = get_connection()
-    try:
+    with pooled_connection() as conn:
         yield conn
-    finally:
-        conn.close()
+
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout) -> JSONResponse:
+    # Every pooled connection stayed busy for the whole checkout timeout:
+    # shed load instead of queueing more requests behind the pool.
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 
 # ---------------------------------------------------------------------------
@@ -73,18 +97,39 @@ def get_db() -> Generator[sqlite3.Connection, None, None]:
 # ---------------------------------------------------------------------------
 
 
-def _step_to_response(row: sqlite3.Row) -> StepStateResponse:
-    return StepStateResponse(
-        id=row["id"],
-        step_id=row["step_id"],
-        step_index=row["step_index"],
-        status=row["status"],
-        retry_count=row["retry_count"],
-        max_retries=row["max_retries"],
-        started_at=row["started_at"],
-        completed_at=row["completed_at"],
-        error_message=row["error_message"],
-    )
+# Routes return plain dicts/rows: FastAPI validates and serializes them against
+# the route's response_model once (dropping extra columns). Building the model
+# in the route as well would validate every row twice.
+
+
+def _workflow_detail(row: sqlite3.Row) -> dict:
+    return {**dict(row), "definition": parse_definition(row["id"], row["definition"])}
+
+
+def _run_detail(run_row: sqlite3.Row, step_rows: list[sqlite3.Row]) -> dict:
+    return {**dict(run_row), "steps": [dict(s) for s in step_rows]}
+
+
+def _etag(*parts: str) -> str:
+    digest = hashlib.blake2b("\0".join(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+@functools.lru_cache(maxsize=256)
+def _workflow_etag(workflow_id: str, definition_json: str) -> str:
+    return _etag(workflow_id, definition_json)
+
+
+def _conditional(request: Request, response: Response, etag: str, cache_control: str) -> Response | None:
+    """Stamp ETag/Cache-Control on `response`; return a 304 if the client already has `etag`."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
 
 
 # ---------------------------------------------------------------------------
@@ -98,35 +143,29 @@ def create_workflow_route(
     conn: sqlite3.Connection = Depends(get_db),
 ):
     workflow_id = create_workflow(conn, body.name, body.model_dump_json())
-    row = get_workflow(conn, workflow_id)
-    return WorkflowDetailResponse(
-        id=row["id"],
-        name=row["name"],
-        definition=json.loads(row["definition"]),
-        created_at=row["created_at"],
-    )
+    return _workflow_detail(get_workflow(conn, workflow_id))
 
 
 @app.get("/workflows", response_model=list[WorkflowSummaryResponse])
 def list_workflows(conn: sqlite3.Connection = Depends(get_db)):
-    rows = get_all_workflows(conn)
-    return [WorkflowSummaryResponse(**dict(r)) for r in rows]
+    return get_all_workflows(conn)
 
 
 @app.get("/workflows/{workflow_id}", response_model=WorkflowDetailResponse)
 def get_workflow_route(
     workflow_id: str,
+    request: Request,
+    response: Response,
     conn: sqlite3.Connection = Depends(get_db),
 ):
     row = get_workflow(conn, workflow_id)
     if row is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    return WorkflowDetailResponse(
-        id=row["id"],
-        name=row["name"],
-        definition=json.loads(row["definition"]),
-        created_at=row["created_at"],
-    )
+    etag = _workflow_etag(row["id"], row["definition"])
+    not_modified = _conditional(request, response, etag, "no-cache")
+    if not_modified is not None:
+        return not_modified
+    return _workflow_detail(row)
 
 
 # ---------------------------------------------------------------------------
@@ -148,35 +187,29 @@ def create_run_route(
     if workflow_row is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
-    definition = json.loads(workflow_row["definition"])
-    steps = [WorkflowStep(**s) for s in definition["steps"]]
+    steps = parse_steps(workflow_id, workflow_row["definition"])
 
     order_id = body.order_id if body else None
-    if order_id is not None:
-        active = conn.execute(
-            "SELECT id FROM runs WHERE order_id = ? AND status IN ('pending', 'running')",
-            (order_id,),
-        ).fetchone()
-        if active:
-            raise HTTPException(
-                status_code=409,
-                detail=f"Order {order_id} already has an active run: {active['id']}",
-            )
-    run_id = create_run(conn, workflow_id, order_id=order_id)
-    step_rows = create_steps(conn, run_id, steps)
-    start_run_thread(run_id)
-
-    run_row = get_run_detail(conn, run_id)
-    return RunDetailResponse(
-        **dict(run_row),
-        steps=[_step_to_response(s) for s in step_rows],
-    )
+    # One write transaction: the active-run check, the run and its steps
+    # commit together (no stepless run after a crash, no check/insert race).
+    with write_transaction(conn):
+        if order_id is not None:
+            active_id = get_active_run_id(conn, order_id)
+            if active_id is not None:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Order {order_id} already has an active run: {active_id}",
+                )
+        run_id = insert_run(conn, workflow_id, order_id=order_id)
+        step_rows = insert_steps(conn, run_id, steps)
+    submit_run(run_id)
+
+    return _run_detail(get_run_detail(conn, run_id), step_rows)
 
 
 @app.get("/runs", response_model=list[RunSummaryResponse])
 def list_runs(conn: sqlite3.Connection = Depends(get_db)):
-    rows = get_all_runs(conn)
-    return [RunSummaryResponse(**dict(r)) for r in rows]
+    return get_all_runs(conn)
 
 
 @app.get("/runs/{run_id}", response_model=RunDetailResponse)
@@ -187,11 +220,7 @@ def get_run_route(
     run_row = get_run_detail(conn, run_id)
     if run_row is None:
         raise HTTPException(status_code=404, detail="Run not found")
-    step_rows = get_steps_for_run(conn, run_id)
-    return RunDetailResponse(
-        **dict(run_row),
-        steps=[_step_to_response(s) for s in step_rows],
-    )
+    return _run_detail(run_row, get_step_states_for_run(conn, run_id))
 
 
 # ---------------------------------------------------------------------------
@@ -205,19 +234,26 @@ def create_order_route(
     conn: sqlite3.Connection = Depends(get_db),
 ):
     order_id = create_order(conn, body.amount)
-    row = get_order(conn, order_id)
-    return OrderResponse(**dict(row))
+    return dict(get_order(conn, order_id))
 
 
 @app.get("/orders/{order_id}", response_model=OrderResponse)
 def get_order_route(
     order_id: str,
+    request: Request,
+    response: Response,
     conn: sqlite3.Connection = Depends(get_db),
 ):
     row = get_order(conn, order_id)
     if row is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    return OrderResponse(**dict(row))
+    # Orders change on every transition (which bumps updated_at): clients must
+    # revalidate, but a poll of an unchanged order gets a bodiless 304.
+    etag = _etag(row["id"], row["status"], row["updated_at"])
+    not_modified = _conditional(request, response, etag, "no-cache")
+    if not_modified is not None:
+        return not_modified
+    return dict(row)
 
 
 # ---------------------------------------------------------------------------
@@ -247,20 +283,36 @@ def get_example(filename: str):
 # ---------------------------------------------------------------------------
 
 
-@app.get("/db/snapshot")
+_SNAPSHOT_TABLES = ["workflows", "runs", "steps", "step_results", "orders"]
+# All five counts in one statement; the per-table row queries stay separate
+# because the tables have different columns.
+_SNAPSHOT_COUNTS_SQL = "SELECT " + ", ".join(
+    f"(SELECT COUNT(*) FROM {table}) AS {table}" for table in _SNAPSHOT_TABLES  # noqa: S608
+)
+_SNAPSHOT_ROWS_SQL = {
+    table: f"SELECT * FROM {table} ORDER BY rowid DESC LIMIT 20"  # noqa: S608
+    for table in _SNAPSHOT_TABLES
+}
+
+
+# response_model makes FastAPI convert the rows to JSON types with pydantic-core
+# instead of walking them with jsonable_encoder; the viewer polls this every 1.5s.
+@app.get("/db/snapshot", response_model=dict[str, dict[str, Any]])
 def db_snapshot(conn: sqlite3.Connection = Depends(get_db)):
-    tables = ["workflows", "runs", "steps", "step_results", "orders"]
-    result = {}
-    for table in tables:
-        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]  # noqa: S608
-        rows = conn.execute(
-            f"SELECT * FROM {table} ORDER BY rowid DESC LIMIT 20"  # noqa: S608
-        ).fetchall()
-        result[table] = {
-            "count": count,
-            "rows": [dict(r) for r in rows],
+    # One read transaction: counts and rows come from the same snapshot, and
+    # the WAL read lock is taken once instead of per statement.
+    conn.execute("BEGIN")
+    try:
+        counts = conn.execute(_SNAPSHOT_COUNTS_SQL).fetchone()
+        return {
+            table: {
+                "count": counts[table],
+                "rows": fetchall_dicts(conn.execute(_SNAPSHOT_ROWS_SQL[table])),
+            }
+            for table in _SNAPSHOT_TABLES
         }
-    return result
+    finally:
+        conn.rollback()
 
 
 # ---------------------------------------------------------------------------
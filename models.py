@@ -1,12 +1,19 @@
+from collections import deque
 from typing import Any
 
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 # --- Workflow request models ---
 
 
+# Definition models are frozen: parsed steps and configs are cached per
+# workflow (executor.parse_steps) and shared by every run and worker thread.
+
+
 class WorkflowStepConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     action: str
     duration_seconds: float = 1.0
     fail_probability: float = Field(default=0.0, ge=0.0, le=1.0)
@@ -14,6 +21,8 @@ class WorkflowStepConfig(BaseModel):
 
 
 class WorkflowStep(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: str
     type: str
     config: WorkflowStepConfig
@@ -26,34 +35,36 @@ class CreateWorkflowRequest(BaseModel):
 
     @model_validator(mode="after")
     def validate_steps(self) -> "CreateWorkflowRequest":
-        # Pass 1: check for duplicate step IDs and collect all IDs
+        # Single pass: reject duplicate IDs and build the Kahn's-algorithm
+        # graph (in-degrees, and dependents keyed by the step they depend on)
         all_ids: set[str] = set()
+        in_degree: dict[str, int] = {}
+        dependents: dict[str, list[str]] = {}
         for step in self.steps:
             if step.id in all_ids:
                 raise ValueError(f"Duplicate step id: '{step.id}'")
             all_ids.add(step.id)
-
-        # Pass 2: check that all depends_on references exist
-        for step in self.steps:
-            for dep in step.depends_on:
-                if dep not in all_ids:
-                    raise ValueError(
-                        f"Step '{step.id}' depends on '{dep}' which is not defined in this workflow"
-                    )
-
-        # Pass 3: cycle detection via Kahn's algorithm
-        in_degree = {step.id: len(step.depends_on) for step in self.steps}
-        dependents: dict[str, list[str]] = {step.id: [] for step in self.steps}
-        for step in self.steps:
+            in_degree[step.id] = len(step.depends_on)
             for dep in step.depends_on:
-                dependents[dep].append(step.id)
-
-        queue = [sid for sid in in_degree if in_degree[sid] == 0]
+                dependents.setdefault(dep, []).append(step.id)
+
+        # Every depends_on reference must exist; report the first in step order
+        missing = dependents.keys() - all_ids
+        if missing:
+            step, dep = next(
+                (step, dep) for step in self.steps for dep in step.depends_on if dep in missing
+            )
+            raise ValueError(
+                f"Step '{step.id}' depends on '{dep}' which is not defined in this workflow"
+            )
+
+        # Cycle detection via Kahn's algorithm
+        queue = deque(sid for sid, degree in in_degree.items() if degree == 0)
         visited = 0
         while queue:
-            current = queue.pop(0)
+            current = queue.popleft()
             visited += 1
-            for dependent_id in dependents[current]:
+            for dependent_id in dependents.get(current, ()):
                 in_degree[dependent_id] -= 1
                 if in_degree[dependent_id] == 0:
                     queue.append(dependent_id)
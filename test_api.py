@@ -7,26 +7,28 @@ Usage: uv run pytest test_api.py -v
 """
 
 import json
-import os
-import time
 import uuid
 from unittest.mock import patch
 
 import pytest
 
 import database
-from database import get_connection, init_db
+from actions import validate_order
+from database import get_connection
 from executor import (
     _now,
+    create_run,
+    create_steps,
     get_run_detail,
     get_steps_for_run,
     insert_step_result,
+    recover_interrupted_runs,
     update_run_status,
     update_step_status,
 )
+from models import WorkflowStep
 from tasks import TaskExecutionError
 
-TEST_DB = "/tmp/test_api.db"
 
 SAMPLE_WORKFLOW = {
     "name": "order-processing",
@@ -68,18 +70,6 @@ SAMPLE_WORKFLOW = {
 }
 
 
-@pytest.fixture(autouse=True)
-def setup_db():
-    """Redirect all DB access to a temp file, fresh per test."""
-    database.DB_PATH = database.Path(TEST_DB)
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
-    init_db()
-    yield
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
-
-
 @pytest.fixture
 def client():
     from fastapi.testclient import TestClient
@@ -89,6 +79,30 @@ def client():
         yield c
 
 
+@pytest.fixture
+def wait_for_run(client):
+    """Return wait(run_id) -> run body, which blocks until the run's executor job returns.
+
+    Records the Future of every run the routes submit, so tests wake up the
+    moment the run finishes instead of polling GET /runs/{id}.
+    """
+    import main
+
+    futures = {}
+    submit = main.submit_run
+
+    def recording_submit(run_id, *args, **kwargs):
+        futures[run_id] = future = submit(run_id, *args, **kwargs)
+        return future
+
+    def wait(run_id):
+        futures[run_id].result(timeout=10)
+        return client.get(f"/runs/{run_id}").json()
+
+    with patch("main.submit_run", side_effect=recording_submit):
+        yield wait
+
+
 # ==================================================================
 # Happy path: workflow CRUD
 # ==================================================================
@@ -155,22 +169,38 @@ class TestRunLifecycle:
         assert [s["step_id"] for s in body["steps"]] == ["validate", "charge", "ship"]
         assert [s["step_index"] for s in body["steps"]] == [0, 1, 2]
 
-    def test_run_completes_all_steps(self, client):
+    def test_second_active_run_for_order_conflicts(self, client):
         wf_id = self._create_workflow(client)
-        run_id = client.post(f"/workflows/{wf_id}/runs").json()["id"]
+        order_id = client.post("/orders", json={"amount": 5.0}).json()["id"]
 
-        # Poll until completed (steps are 0.01s each, should finish fast)
-        for _ in range(50):
-            resp = client.get(f"/runs/{run_id}")
-            if resp.json()["status"] == "completed":
-                break
-            time.sleep(0.1)
+        with patch("main.submit_run"):  # keep the first run pending
+            first = client.post(f"/workflows/{wf_id}/runs", json={"order_id": order_id})
+            second = client.post(f"/workflows/{wf_id}/runs", json={"order_id": order_id})
 
-        body = resp.json()
+        assert first.status_code == 202
+        assert second.status_code == 409
+        assert first.json()["id"] in second.json()["detail"]
+        assert len(client.get("/runs").json()) == 1
+
+    def test_run_and_steps_created_atomically(self, client):
+        """If inserting the steps fails, the run row is rolled back too."""
+        wf_id = self._create_workflow(client)
+
+        with patch("main.insert_steps", side_effect=RuntimeError("disk full")):
+            resp = client.post(f"/workflows/{wf_id}/runs")
+
+        assert resp.status_code == 500
+        assert client.get("/runs").json() == []
+
+    def test_run_completes_all_steps(self, client, wait_for_run):
+        wf_id = self._create_workflow(client)
+        run_id = client.post(f"/workflows/{wf_id}/runs").json()["id"]
+
+        body = wait_for_run(run_id)
         assert body["status"] == "completed"
         assert body["started_at"] is not None
         assert body["completed_at"] is not None
-        assert all(s["status"] == "completed" for s in body["steps"])
+        assert {s["status"] for s in body["steps"]} == {"completed"}
         # Steps completed in order
         for i in range(1, len(body["steps"])):
             assert body["steps"][i]["started_at"] >= body["steps"][i - 1]["completed_at"]
@@ -196,7 +226,7 @@ class TestRunLifecycle:
         assert resp.status_code == 404
         assert resp.json()["detail"] == "Run not found"
 
-    def test_multiple_runs_same_workflow(self, client):
+    def test_multiple_runs_same_workflow(self, client, wait_for_run):
         wf_id = self._create_workflow(client)
         run_a = client.post(f"/workflows/{wf_id}/runs").json()
         run_b = client.post(f"/workflows/{wf_id}/runs").json()
@@ -206,10 +236,7 @@ class TestRunLifecycle:
 
         # Wait for both to complete
         for run_id in [run_a["id"], run_b["id"]]:
-            for _ in range(50):
-                if client.get(f"/runs/{run_id}").json()["status"] == "completed":
-                    break
-                time.sleep(0.1)
+            wait_for_run(run_id)
 
         runs = client.get("/runs").json()
         assert all(r["status"] == "completed" for r in runs)
@@ -312,7 +339,7 @@ class TestOrderRoutes:
 # Failure handling
 # ==================================================================
 class TestFailures:
-    def test_step_permanent_failure_fails_run(self, client):
+    def test_step_permanent_failure_fails_run(self, client, wait_for_run):
         """A step with fail_probability=1.0 and no retries should fail the run."""
         wf = {
             "name": "fail-test",
@@ -333,11 +360,7 @@ class TestFailures:
         wf_id = client.post("/workflows", json=wf).json()["id"]
         run_id = client.post(f"/workflows/{wf_id}/runs").json()["id"]
 
-        for _ in range(50):
-            body = client.get(f"/runs/{run_id}").json()
-            if body["status"] in ("completed", "failed"):
-                break
-            time.sleep(0.1)
+        body = wait_for_run(run_id)
 
         assert body["status"] == "failed"
         steps = body["steps"]
@@ -346,7 +369,7 @@ class TestFailures:
         assert steps[1]["error_message"] is not None
         assert steps[2]["status"] == "pending"  # never reached
 
-    def test_retry_then_succeed(self, client):
+    def test_retry_then_succeed(self, client, wait_for_run):
         """A flaky step should retry and eventually succeed."""
         wf = {
             "name": "retry-test",
@@ -370,17 +393,13 @@ class TestFailures:
 
         with patch("executor.execute_task", side_effect=mock_task):
             run_id = client.post(f"/workflows/{wf_id}/runs").json()["id"]
-            for _ in range(50):
-                body = client.get(f"/runs/{run_id}").json()
-                if body["status"] in ("completed", "failed"):
-                    break
-                time.sleep(0.1)
+            body = wait_for_run(run_id)
 
         assert body["status"] == "completed"
         assert body["steps"][0]["retry_count"] == 2
         assert call_count == 3
 
-    def test_retry_exhaustion(self, client):
+    def test_retry_exhaustion(self, client, wait_for_run):
         """A step that always fails should exhaust retries and fail the run."""
         wf = {
             "name": "exhaust-test",
@@ -394,11 +413,7 @@ class TestFailures:
         wf_id = client.post("/workflows", json=wf).json()["id"]
         run_id = client.post(f"/workflows/{wf_id}/runs").json()["id"]
 
-        for _ in range(50):
-            body = client.get(f"/runs/{run_id}").json()
-            if body["status"] in ("completed", "failed"):
-                break
-            time.sleep(0.1)
+        body = wait_for_run(run_id)
 
         assert body["status"] == "failed"
         step = body["steps"][0]
@@ -411,48 +426,37 @@ class TestFailures:
 # Durability / crash recovery
 # ==================================================================
 class TestDurability:
-    def _create_workflow_and_run(self, client):
+    def _create_workflow_and_run(self, client, conn):
         """Create a workflow and manually set up a run (no background thread)."""
         wf_id = client.post("/workflows", json=SAMPLE_WORKFLOW).json()["id"]
-        conn = get_connection()
-        try:
-            from executor import create_run, create_steps
-            from models import WorkflowStep
-
-            wf_row = client.get(f"/workflows/{wf_id}").json()
-            steps = [WorkflowStep(**s) for s in wf_row["definition"]["steps"]]
-            run_id = create_run(conn, wf_id)
-            create_steps(conn, run_id, steps)
-            return wf_id, run_id
-        finally:
-            conn.close()
+        wf_row = client.get(f"/workflows/{wf_id}").json()
+        steps = [WorkflowStep(**s) for s in wf_row["definition"]["steps"]]
+        run_id = create_run(conn, wf_id)
+        create_steps(conn, run_id, steps)
+        return wf_id, run_id
 
-    def test_recovery_resumes_running_run(self, client):
+    def test_recovery_resumes_running_run(self, client, conn):
         """Simulate crash: run is 'running', all steps 'pending'.
         Recovery should resume and complete it."""
-        wf_id, run_id = self._create_workflow_and_run(client)
+        wf_id, run_id = self._create_workflow_and_run(client, conn)
 
-        conn = get_connection()
         update_run_status(conn, run_id, "running", started_at=_now())
         conn.commit()
-        conn.close()
 
         # Trigger recovery (simulates server restart)
-        from executor import recover_interrupted_runs
-        threads = recover_interrupted_runs()
-        for t in threads:
-            t.join(timeout=10)
+        futures = recover_interrupted_runs()
+        for f in futures:
+            f.result(timeout=10)
 
         body = client.get(f"/runs/{run_id}").json()
         assert body["status"] == "completed"
-        assert all(s["status"] == "completed" for s in body["steps"])
+        assert {s["status"] for s in body["steps"]} == {"completed"}
 
-    def test_recovery_skips_completed_steps(self, client):
+    def test_recovery_skips_completed_steps(self, client, conn):
         """Simulate crash after first step completes.
         Recovery should skip completed step and finish the rest."""
-        wf_id, run_id = self._create_workflow_and_run(client)
+        wf_id, run_id = self._create_workflow_and_run(client, conn)
 
-        conn = get_connection()
         update_run_status(conn, run_id, "running", started_at=_now())
         conn.commit()
 
@@ -465,20 +469,18 @@ class TestDurability:
         )
         insert_step_result(conn, idem_key, steps[0]["id"], {"status": "success"})
         conn.commit()
-        conn.close()
 
-        from executor import recover_interrupted_runs
-        threads = recover_interrupted_runs()
-        for t in threads:
-            t.join(timeout=10)
+        futures = recover_interrupted_runs()
+        for f in futures:
+            f.result(timeout=10)
 
         body = client.get(f"/runs/{run_id}").json()
         assert body["status"] == "completed"
-        assert all(s["status"] == "completed" for s in body["steps"])
+        assert {s["status"] for s in body["steps"]} == {"completed"}
         # First step was not re-executed (retry_count still 0)
         assert body["steps"][0]["retry_count"] == 0
 
-    def test_recovery_idempotency_with_committed_result(self, client):
+    def test_recovery_idempotency_with_committed_result(self, client, conn):
         """Simulate crash: step is 'running' with idem key and result already committed.
         Recovery should detect the result and skip re-execution."""
         wf = {
@@ -492,10 +494,6 @@ class TestDurability:
         }
         wf_id = client.post("/workflows", json=wf).json()["id"]
 
-        conn = get_connection()
-        from executor import create_run, create_steps
-        from models import WorkflowStep
-
         steps_def = [WorkflowStep(**s) for s in wf["steps"]]
         run_id = create_run(conn, wf_id)
         step_rows = create_steps(conn, run_id, steps_def)
@@ -509,32 +507,27 @@ class TestDurability:
         )
         insert_step_result(conn, idem_key, step_rows[0]["id"], {"status": "success"})
         conn.commit()
-        conn.close()
 
         # If idempotency fails, this would take 5s and always fail
-        from executor import recover_interrupted_runs
-        threads = recover_interrupted_runs()
-        for t in threads:
-            t.join(timeout=10)
+        futures = recover_interrupted_runs()
+        for f in futures:
+            f.result(timeout=10)
 
         body = client.get(f"/runs/{run_id}").json()
         assert body["status"] == "completed"
         assert body["steps"][0]["status"] == "completed"
 
-    def test_recovery_preserves_started_at(self, client):
+    def test_recovery_preserves_started_at(self, client, conn):
         """Recovery should not overwrite the original started_at timestamp."""
-        wf_id, run_id = self._create_workflow_and_run(client)
+        wf_id, run_id = self._create_workflow_and_run(client, conn)
 
         original_started = "2025-01-01T00:00:00+00:00"
-        conn = get_connection()
         update_run_status(conn, run_id, "running", started_at=original_started)
         conn.commit()
-        conn.close()
 
-        from executor import recover_interrupted_runs
-        threads = recover_interrupted_runs()
-        for t in threads:
-            t.join(timeout=10)
+        futures = recover_interrupted_runs()
+        for f in futures:
+            f.result(timeout=10)
 
         body = client.get(f"/runs/{run_id}").json()
         assert body["status"] == "completed"
@@ -557,7 +550,7 @@ class TestResponseShapes:
             "retry_count", "max_retries",
             "started_at", "completed_at", "error_message",
         }
-        assert set(step.keys()) == expected_keys
+        assert step.keys() == expected_keys
         # Internal fields should NOT leak
         assert "run_id" not in step
         assert "idempotency_key" not in step
@@ -572,7 +565,7 @@ class TestResponseShapes:
             "id", "workflow_id", "workflow_name", "order_id", "status",
             "started_at", "completed_at", "steps",
         }
-        assert set(body.keys()) == expected_keys
+        assert body.keys() == expected_keys
 
     def test_workflow_summary_vs_detail(self, client):
         """List excludes definition, detail includes it."""
@@ -586,6 +579,61 @@ class TestResponseShapes:
         assert summary["id"] == detail["id"]
         assert summary["name"] == detail["name"]
 
+    def test_pool_exhausted_returns_503(self, client, monkeypatch):
+        def exhausted_pool():
+            raise database.PoolTimeout("No pooled database connection free after 30s")
+
+        monkeypatch.setattr("main.pooled_connection", exhausted_pool)
+        resp = client.get("/workflows")
+        assert resp.status_code == 503
+        assert resp.headers["retry-after"] == "1"
+        assert "No pooled database connection" in resp.json()["detail"]
+
+    def test_workflow_detail_etag(self, client):
+        wf_id = client.post("/workflows", json=SAMPLE_WORKFLOW).json()["id"]
+
+        first = client.get(f"/workflows/{wf_id}")
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "no-cache"
+
+        cached = client.get(f"/workflows/{wf_id}", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+
+        other = client.get(f"/workflows/{wf_id}", headers={"If-None-Match": '"stale"'})
+        assert other.status_code == 200
+        assert other.json() == first.json()
+
+    def test_order_etag_changes_with_status(self, client):
+        order_id = client.post("/orders", json={"amount": 5.0}).json()["id"]
+        etag = client.get(f"/orders/{order_id}").headers["etag"]
+        assert client.get(f"/orders/{order_id}", headers={"If-None-Match": etag}).status_code == 304
+
+        conn = get_connection()
+        try:
+            validate_order(conn, order_id)
+            conn.commit()
+        finally:
+            conn.close()
+
+        resp = client.get(f"/orders/{order_id}", headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.json()["status"] == "validated"
+        assert resp.headers["etag"] != etag
+
+    def test_db_snapshot_shape(self, client):
+        """Snapshot has every table with a count and its newest rows."""
+        client.post("/workflows", json=SAMPLE_WORKFLOW)
+        client.post("/orders", json={"amount": 5.0})
+
+        body = client.get("/db/snapshot").json()
+        assert set(body) == {"workflows", "runs", "steps", "step_results", "orders"}
+        assert body["workflows"]["count"] == 1
+        assert body["workflows"]["rows"][0]["name"] == "order-processing"
+        assert body["orders"]["count"] == len(body["orders"]["rows"]) == 1
+        assert body["runs"] == {"count": 0, "rows": []}
+
 
 # ==================================================================
 # Phase 12: Action dispatch via API
@@ -624,7 +672,7 @@ class TestActionDispatchAPI:
         assert "order_id" in runs[0]
         assert runs[0]["order_id"] == order_id
 
-    def test_e2e_order_processing_via_api(self, client):
+    def test_e2e_order_processing_via_api(self, client, wait_for_run):
         """Full E2E via API: order progresses pending -> validated -> charged -> shipped."""
         # Create order
         order_id = client.post("/orders", json={"amount": 99.99}).json()["id"]
@@ -637,28 +685,20 @@ class TestActionDispatchAPI:
         ).json()["id"]
 
         # Wait for run to complete
-        for _ in range(100):
-            body = client.get(f"/runs/{run_id}").json()
-            if body["status"] in ("completed", "failed"):
-                break
-            time.sleep(0.1)
+        body = wait_for_run(run_id)
 
         assert body["status"] == "completed"
-        assert all(s["status"] == "completed" for s in body["steps"])
+        assert {s["status"] for s in body["steps"]} == {"completed"}
 
         # Verify order progressed to shipped
         order = client.get(f"/orders/{order_id}").json()
         assert order["status"] == "shipped"
 
-    def test_run_without_order_actions_noop(self, client):
+    def test_run_without_order_actions_noop(self, client, wait_for_run):
         """Run without order_id: action dispatch is silently skipped."""
         wf_id = client.post("/workflows", json=SAMPLE_WORKFLOW).json()["id"]
         run_id = client.post(f"/workflows/{wf_id}/runs").json()["id"]
 
-        for _ in range(100):
-            body = client.get(f"/runs/{run_id}").json()
-            if body["status"] in ("completed", "failed"):
-                break
-            time.sleep(0.1)
+        body = wait_for_run(run_id)
 
         assert body["status"] == "completed"
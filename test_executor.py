@@ -7,16 +7,25 @@ Usage: uv run pytest test_executor.py -v
 """
 
 import json
-import os
+import re
+import sqlite3
+import threading
 import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from unittest.mock import patch
 
 import pytest
+from pydantic import ValidationError
 
 import database
-from database import get_connection, init_db
+from database import get_connection, write_transaction
 from executor import (
+    BRANCH_POOL_MAX_WORKERS,
+    RUN_POOL_MAX_WORKERS,
     _now,
+    _step_configs,
+    _uuid4_batch,
     check_step_result,
     create_order,
     create_run,
@@ -28,44 +37,33 @@ from executor import (
     get_all_workflows,
     get_order,
     get_run_detail,
+    get_run_with_definition,
     get_running_runs,
+    get_resumable_runs_with_definitions,
+    get_step_by_id,
+    get_step_states_for_run,
+    get_step_for_execution,
+    get_steps_for_execution,
     get_steps_for_run,
     get_workflow,
     insert_step_result,
+    parse_definition,
+    parse_steps,
     recover_interrupted_runs,
-    start_run_thread,
+    shutdown_run_pool,
+    step_result_exists,
+    submit_run,
     topological_sort,
     update_run_status,
     update_step_status,
 )
-from models import CreateWorkflowRequest, WorkflowStep, WorkflowStepConfig
+from models import CreateWorkflowRequest, StepStateResponse, WorkflowStep, WorkflowStepConfig
 from tasks import TaskExecutionError, execute_task
 
-TEST_DB = "/tmp/test_executor.db"
 
-
-@pytest.fixture(autouse=True)
-def setup_db():
-    """Use a temp DB for every test session."""
-    database.DB_PATH = database.Path(TEST_DB)
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
-    init_db()
-    yield
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
-
-
-@pytest.fixture
-def conn():
-    c = get_connection()
-    yield c
-    c.close()
-
-
-@pytest.fixture
+@pytest.fixture(scope="module")
 def sample_workflow():
-    """A 3-step order-processing workflow request."""
+    """A 3-step order-processing workflow request, shared read-only by the module's tests."""
     return CreateWorkflowRequest(
         name="order-processing",
         steps=[
@@ -102,13 +100,37 @@ def sample_workflow():
 
 def _create_full_run(conn, wf_request):
     """Helper: create workflow + run + steps, return (wf_id, run_id, step_rows)."""
-    definition_json = json.dumps(wf_request.model_dump())
-    wf_id = create_workflow(conn, wf_request.name, definition_json)
+    wf_id = create_workflow(conn, wf_request.name, wf_request.model_dump_json())
     run_id = create_run(conn, wf_id)
     step_rows = create_steps(conn, run_id, wf_request.steps)
     return wf_id, run_id, step_rows
 
 
+@contextmanager
+def count_queries():
+    """Record the SQL of every statement on connections opened inside the block.
+
+    Covers recovery's own connection and the run-pool workers' thread
+    connections (retired on entry, so workers reopen through the hook).
+    """
+    statements = []
+    open_connection = database.get_connection
+
+    def traced_connection():
+        c = open_connection()
+        c.set_trace_callback(statements.append)
+        return c
+
+    database.close_thread_connections()
+    with patch("database.get_connection", side_effect=traced_connection):
+        yield statements
+    database.close_thread_connections()
+
+
+def _selects(statements):
+    return [sql for sql in statements if sql.startswith("SELECT")]
+
+
 # ==================================================================
 # Test 1: Full happy-path workflow simulation
 # ==================================================================
@@ -116,8 +138,8 @@ class TestHappyPath:
     def test_full_execution(self, conn, sample_workflow):
         wf_id, run_id, step_rows = _create_full_run(conn, sample_workflow)
 
+        # Committed with the first step's "running" transition, as execute_run does
         update_run_status(conn, run_id, "running", started_at=_now())
-        conn.commit()
 
         for step_row in step_rows:
             sid = step_row["id"]
@@ -143,7 +165,7 @@ class TestHappyPath:
         steps = get_steps_for_run(conn, run_id)
 
         assert run["status"] == "completed"
-        assert all(s["status"] == "completed" for s in steps)
+        assert {s["status"] for s in steps} == {"completed"}
         assert [s["step_id"] for s in steps] == ["validate", "charge", "ship"]
         assert all(s["started_at"] is not None for s in steps)
         assert all(s["completed_at"] is not None for s in steps)
@@ -172,8 +194,8 @@ class TestRetry:
         )
         wf_id, run_id, step_rows = _create_full_run(conn, wf)
 
+        # Committed with the first step's "running" transition, as execute_run does
         update_run_status(conn, run_id, "running", started_at=_now())
-        conn.commit()
 
         sid = step_rows[0]["id"]
         max_retries = step_rows[0]["max_retries"]
@@ -201,7 +223,7 @@ class TestRetry:
                     )
                     conn.commit()
 
-        failed_step = get_steps_for_run(conn, run_id)[0]
+        failed_step = get_step_by_id(conn, sid)
         assert failed_step["status"] == "failed"
         assert failed_step["retry_count"] == 3
         assert failed_step["error_message"] is not None
@@ -246,7 +268,7 @@ class TestIdempotency:
         insert_step_result(conn, idem_key, sid, result)
         conn.commit()  # Result committed but step still "running"
 
-        step_state = get_steps_for_run(conn, run_id)[0]
+        step_state = get_step_by_id(conn, sid)
         assert step_state["status"] == "running"
         assert check_step_result(conn, idem_key) is not None
 
@@ -256,14 +278,14 @@ class TestIdempotency:
         update_step_status(conn, sid, "completed", completed_at=_now())
         conn.commit()
 
-        recovered = get_steps_for_run(conn, run_id)[0]
+        recovered = get_step_by_id(conn, sid)
         assert recovered["status"] == "completed"
 
         # No duplicate results
-        count = conn.execute(
-            "SELECT COUNT(*) FROM step_results WHERE step_id = ?", (sid,)
-        ).fetchone()[0]
-        assert count == 1
+        rows = conn.execute(
+            "SELECT 1 FROM step_results WHERE step_id = ? LIMIT 2", (sid,)
+        ).fetchall()
+        assert len(rows) == 1
 
 
 # ==================================================================
@@ -284,6 +306,26 @@ class TestConcurrentRuns:
         assert steps_a[0]["id"] != steps_b[0]["id"]
         assert steps_a[0]["step_id"] == steps_b[0]["step_id"] == "validate"
 
+    def test_create_steps_beyond_one_insert_batch(self, conn):
+        """Workflows larger than one multi-row INSERT still get every step, in order."""
+        n = 400
+        wf = CreateWorkflowRequest(
+            name="wide",
+            steps=[
+                WorkflowStep(
+                    id=f"s{i}", type="task",
+                    config=WorkflowStepConfig(action="x"),
+                    depends_on=[f"s{i - 1}"] if i else [],
+                )
+                for i in range(n)
+            ],
+        )
+        _, run_id, step_rows = _create_full_run(conn, wf)
+
+        assert [s["step_index"] for s in step_rows] == list(range(n))
+        assert [s["step_id"] for s in step_rows] == [f"s{i}" for i in range(n)]
+        assert [s["id"] for s in step_rows] == [s["id"] for s in get_steps_for_run(conn, run_id)]
+
     def test_running_runs_tracking(self, conn, sample_workflow):
         wf_id, _, _ = _create_full_run(conn, sample_workflow)
 
@@ -341,8 +383,8 @@ class TestPartialFailure:
             ],
         )
         wf_id, run_id, steps = _create_full_run(conn, wf)
+        # Committed with the first step's "running" transition, as execute_run does
         update_run_status(conn, run_id, "running", started_at=_now())
-        conn.commit()
 
         # Step 1 succeeds
         idem1 = str(uuid.uuid4())
@@ -415,6 +457,14 @@ class TestDefinitionRoundtrip:
         assert len(rows) >= 1
         assert "definition" not in rows[0].keys()
 
+    def test_fetchall_dicts(self, conn):
+        create_workflow(conn, "test", '{"steps": []}')
+        rows = database.fetchall_dicts(conn.execute("SELECT id, name FROM workflows"))
+        assert type(rows[0]) is dict
+        assert list(rows[0]) == ["id", "name"]
+        assert rows[0]["name"] == "test"
+        assert database.fetchall_dicts(conn.execute("SELECT id FROM workflows WHERE 0")) == []
+
 
 # ==================================================================
 # Test 7: Order lifecycle
@@ -431,12 +481,11 @@ class TestOrderLifecycle:
     def test_status_progression(self, conn):
         order_id = create_order(conn, 49.99)
 
-        for new_status in ["validated", "charged", "shipped"]:
-            conn.execute(
-                "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
-                (new_status, _now(), order_id),
-            )
-            conn.commit()
+        conn.executemany(
+            "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
+            [(new_status, _now(), order_id) for new_status in ["validated", "charged", "shipped"]],
+        )
+        conn.commit()
 
         final = get_order(conn, order_id)
         assert final["status"] == "shipped"
@@ -459,6 +508,54 @@ class TestEdgeCases:
     def test_steps_for_nonexistent_run(self, conn):
         assert get_steps_for_run(conn, "fake-id") == []
 
+    def test_step_by_id(self, conn, sample_workflow):
+        _, _, step_rows = _create_full_run(conn, sample_workflow)
+        step = get_step_by_id(conn, step_rows[1]["id"])
+        assert step["step_id"] == "charge"
+        assert get_step_by_id(conn, "fake-id") is None
+
+    def test_steps_for_execution_projection(self, conn, sample_workflow):
+        """The executor's step reads carry only the columns it uses."""
+        _, run_id, step_rows = _create_full_run(conn, sample_workflow)
+
+        steps = get_steps_for_execution(conn, run_id)
+        assert [s["id"] for s in steps] == [s["id"] for s in step_rows]
+        assert steps[0].keys() == [
+            "id", "step_id", "step_index", "status", "retry_count", "max_retries", "idempotency_key",
+        ]
+        assert dict(get_step_for_execution(conn, step_rows[1]["id"])) == dict(steps[1])
+        assert get_step_for_execution(conn, "fake-id") is None
+
+    def test_run_step_reads_walk_index_in_order(self, conn):
+        """Per-run step reads search idx_steps_run_id and need no sort for ORDER BY step_index."""
+        statements = []
+        conn.set_trace_callback(statements.append)
+        get_steps_for_run(conn, "run-id")
+        get_steps_for_execution(conn, "run-id")
+        get_step_states_for_run(conn, "run-id")
+        conn.set_trace_callback(None)
+
+        assert len(statements) == 3
+        for sql in statements:
+            plan = " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            assert "idx_steps_run_id (run_id=?)" in plan, sql
+            assert "TEMP B-TREE" not in plan, sql
+
+    def test_step_rows_unique_per_run(self, conn, sample_workflow):
+        """Creating a run's steps twice is rejected by the (run_id, step_id) index."""
+        _, run_id, _ = _create_full_run(conn, sample_workflow)
+
+        with pytest.raises(sqlite3.IntegrityError):
+            create_steps(conn, run_id, sample_workflow.steps)
+        assert len(get_steps_for_run(conn, run_id)) == len(sample_workflow.steps)
+
+    def test_step_states_match_response_model(self, conn, sample_workflow):
+        _, run_id, step_rows = _create_full_run(conn, sample_workflow)
+
+        states = get_step_states_for_run(conn, run_id)
+        assert states[0].keys() == list(StepStateResponse.model_fields)
+        assert [s["id"] for s in states] == [s["id"] for s in step_rows]
+
     def test_no_running_runs_initially(self, conn):
         assert get_running_runs(conn) == []
 
@@ -483,6 +580,19 @@ class TestEdgeCases:
         assert result is not None
         assert result["result_data"] is None
 
+    def test_now_is_utc_iso8601(self):
+        before = datetime.now(timezone.utc)
+        stamp = _now()
+        after = datetime.now(timezone.utc)
+        assert re.fullmatch(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}\+00:00", stamp)
+        assert before <= datetime.fromisoformat(stamp) <= after
+
+    def test_uuid4_batch(self):
+        ids = _uuid4_batch(4)
+        assert len(set(ids)) == 4
+        assert all(uuid.UUID(i).version == 4 for i in ids)
+        assert _uuid4_batch(0) == []
+
     def test_single_step_workflow(self, conn):
         wf = CreateWorkflowRequest(
             name="single-step",
@@ -509,6 +619,96 @@ class TestEdgeCases:
     def test_check_nonexistent_idempotency_key(self, conn):
         assert check_step_result(conn, "nonexistent-key") is None
 
+    def test_step_result_exists(self, conn, sample_workflow):
+        _, _, steps = _create_full_run(conn, sample_workflow)
+        insert_step_result(conn, "idem-1", steps[0]["id"], {"status": "success"})
+        conn.commit()
+
+        assert step_result_exists(conn, "idem-1") is True
+        assert step_result_exists(conn, "nonexistent-key") is False
+
+    def test_write_transaction_rolls_back_on_error(self, conn):
+        order_id = create_order(conn, 10.0)
+        with pytest.raises(RuntimeError):
+            with write_transaction(conn):
+                conn.execute("UPDATE orders SET status = 'shipped' WHERE id = ?", (order_id,))
+                raise RuntimeError("boom")
+
+        assert not conn.in_transaction
+        assert get_order(conn, order_id)["status"] == "pending"
+
+
+class TestThreadConnections:
+    def test_reused_within_thread(self):
+        with database.thread_connection() as first:
+            pass
+        with database.thread_connection() as second:
+            assert second is first
+
+    def test_distinct_per_thread(self):
+        seen = []
+
+        def use():
+            with database.thread_connection() as conn:
+                seen.append(conn)
+
+        t = threading.Thread(target=use)
+        t.start()
+        t.join()
+        with database.thread_connection() as conn:
+            assert seen[0] is not conn
+
+    def test_close_thread_connections_closes_idle(self):
+        with database.thread_connection() as first:
+            pass
+        database.close_thread_connections()
+        with pytest.raises(sqlite3.ProgrammingError):
+            first.execute("SELECT 1")
+        with database.thread_connection() as second:
+            assert second is not first
+            assert second.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 0
+
+    def test_in_use_connection_closed_by_owner(self):
+        in_block, release = threading.Event(), threading.Event()
+        seen = []
+
+        def use():
+            with database.thread_connection() as conn:
+                seen.append(conn)
+                in_block.set()
+                release.wait(5)
+                seen.append(conn.execute("SELECT 1").fetchone()[0])
+
+        t = threading.Thread(target=use)
+        t.start()
+        assert in_block.wait(5)
+        database.close_thread_connections()
+        release.set()
+        t.join()
+        assert seen[1] == 1
+        with pytest.raises(sqlite3.ProgrammingError):
+            seen[0].execute("SELECT 1")
+
+
+class TestConnectionPool:
+    def test_connection_reused(self):
+        with database.pooled_connection() as first:
+            pass
+        with database.pooled_connection() as second:
+            assert second is first
+
+    def test_uncommitted_work_rolled_back_on_return(self, conn):
+        with database.pooled_connection() as pooled:
+            create_order(pooled, 10.0)  # commits
+            pooled.execute("DELETE FROM orders")  # left uncommitted
+        assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 1
+
+    def test_checkout_bounded(self, monkeypatch):
+        monkeypatch.setattr(database, "_pool_slots", threading.BoundedSemaphore(1))
+        with database.pooled_connection():
+            with pytest.raises(TimeoutError):
+                with database.pooled_connection(timeout=0.01):
+                    pass
 
 # ==================================================================
 # Test 9: execute_step — direct unit tests
@@ -523,7 +723,7 @@ class TestExecuteStep:
         outcome = execute_step(conn, step_rows[0], config)
 
         assert outcome == "completed"
-        step = get_steps_for_run(conn, run_id)[0]
+        step = get_step_by_id(conn, step_rows[0]["id"])
         assert step["status"] == "completed"
         assert step["started_at"] is not None
         assert step["completed_at"] is not None
@@ -548,7 +748,6 @@ class TestExecuteStep:
         )
         _, run_id, step_rows = _create_full_run(conn, wf)
         update_run_status(conn, run_id, "running", started_at=_now())
-        conn.commit()
 
         # Simulate crash: step has idem key + result committed, but status still "running"
         idem_key = str(uuid.uuid4())
@@ -557,7 +756,7 @@ class TestExecuteStep:
         conn.commit()
 
         # Re-fetch the step (now has idem_key set)
-        step = get_steps_for_run(conn, run_id)[0]
+        step = get_step_by_id(conn, step_rows[0]["id"])
         assert step["idempotency_key"] == idem_key
 
         # execute_step should reuse the existing idem key, find the result, and skip.
@@ -565,7 +764,7 @@ class TestExecuteStep:
         outcome = execute_step(conn, step, wf.steps[0].config)
         assert outcome == "completed"
 
-        final = get_steps_for_run(conn, run_id)[0]
+        final = get_step_by_id(conn, step_rows[0]["id"])
         assert final["status"] == "completed"
         assert final["idempotency_key"] == idem_key  # key was reused, not replaced
 
@@ -595,11 +794,11 @@ class TestExecuteStep:
         conn.commit()
         assert check_step_result(conn, idem_key) is None
 
-        step = get_steps_for_run(conn, run_id)[0]
+        step = get_step_by_id(conn, step_rows[0]["id"])
         outcome = execute_step(conn, step, wf.steps[0].config)
 
         assert outcome == "completed"
-        final = get_steps_for_run(conn, run_id)[0]
+        final = get_step_by_id(conn, step_rows[0]["id"])
         assert final["status"] == "completed"
         # Result now exists for the reused idem key
         assert check_step_result(conn, idem_key) is not None
@@ -625,7 +824,7 @@ class TestExecuteStep:
         outcome = execute_step(conn, step_rows[0], wf.steps[0].config)
         assert outcome == "retry"
 
-        step = get_steps_for_run(conn, run_id)[0]
+        step = get_step_by_id(conn, step_rows[0]["id"])
         assert step["status"] == "pending"
         assert step["retry_count"] == 1
         # New idem key was generated for next attempt
@@ -652,7 +851,7 @@ class TestExecuteStep:
         outcome = execute_step(conn, step_rows[0], wf.steps[0].config)
         assert outcome == "failed"
 
-        step = get_steps_for_run(conn, run_id)[0]
+        step = get_step_by_id(conn, step_rows[0]["id"])
         assert step["status"] == "failed"
         assert step["error_message"] is not None
 
@@ -674,7 +873,7 @@ class TestExecuteRun:
 
         steps = get_steps_for_run(conn, run_id)
         assert len(steps) == 3
-        assert all(s["status"] == "completed" for s in steps)
+        assert {s["status"] for s in steps} == {"completed"}
         assert [s["step_id"] for s in steps] == ["validate", "charge", "ship"]
         # Steps completed in order (each started_at >= previous completed_at)
         for i in range(1, len(steps)):
@@ -716,6 +915,98 @@ class TestExecuteRun:
         assert steps[1]["status"] == "failed"
         assert steps[2]["status"] == "pending"
 
+    @staticmethod
+    def _diamond(branch_b_fails=False):
+        """start -> (branch-a, branch-b) -> merge."""
+        def step(step_id, depends_on=(), fail_probability=0.0):
+            return WorkflowStep(
+                id=step_id, type="task",
+                config=WorkflowStepConfig(
+                    action=step_id, duration_seconds=0.01, fail_probability=fail_probability,
+                ),
+                depends_on=list(depends_on),
+            )
+
+        return CreateWorkflowRequest(
+            name="diamond",
+            steps=[
+                step("start"),
+                step("branch-a", ["start"]),
+                step("branch-b", ["start"], fail_probability=1.0 if branch_b_fails else 0.0),
+                step("merge", ["branch-a", "branch-b"]),
+            ],
+        )
+
+    def test_independent_steps_run_concurrently(self, conn):
+        """Both branches of a diamond are in flight at once; merge waits for both."""
+        _, run_id, _ = _create_full_run(conn, self._diamond())
+        both_branches = threading.Barrier(2, timeout=5)
+
+        def mock_execute_task(config):
+            if config.action.startswith("branch-"):
+                both_branches.wait()  # BrokenBarrierError unless the other branch is running
+            return {"action": config.action, "status": "success"}
+
+        with patch("executor.execute_task", side_effect=mock_execute_task):
+            execute_run(run_id)
+
+        assert get_run_detail(conn, run_id)["status"] == "completed"
+        steps = {s["step_id"]: s for s in get_steps_for_run(conn, run_id)}
+        assert {s["status"] for s in steps.values()} == {"completed"}
+        assert steps["merge"]["started_at"] >= max(
+            steps["branch-a"]["completed_at"], steps["branch-b"]["completed_at"]
+        )
+
+    def test_branches_share_one_bounded_pool(self, conn):
+        """Concurrent steps of successive runs reuse the shared branch pool's threads."""
+        branch_threads = set()
+
+        def mock_execute_task(config):
+            if config.action.startswith("branch-"):
+                branch_threads.add(threading.current_thread())
+            return {"action": config.action, "status": "success"}
+
+        with patch("executor.execute_task", side_effect=mock_execute_task):
+            for _ in range(5):
+                _, run_id, _ = _create_full_run(conn, self._diamond())
+                execute_run(run_id)
+                assert get_run_detail(conn, run_id)["status"] == "completed"
+
+        assert all(t.name.startswith("branch") for t in branch_threads)
+        assert len(branch_threads) <= BRANCH_POOL_MAX_WORKERS
+
+    def test_failed_branch_fails_run_after_sibling_finishes(self, conn):
+        """A branch fails → its sibling still completes, the join step never starts."""
+        _, run_id, _ = _create_full_run(conn, self._diamond(branch_b_fails=True))
+
+        execute_run(run_id)
+
+        assert get_run_detail(conn, run_id)["status"] == "failed"
+        steps = {s["step_id"]: s["status"] for s in get_steps_for_run(conn, run_id)}
+        assert steps == {
+            "start": "completed", "branch-a": "completed", "branch-b": "failed", "merge": "pending",
+        }
+
+    def test_steps_reread_only_for_retries(self, conn, sample_workflow):
+        """First attempts use the run's step read; only a retry re-fetches its step."""
+        _, run_id, _ = _create_full_run(conn, sample_workflow)
+        attempts = {"charge": 0}
+
+        def flaky_charge(config):
+            if config.action == "charge_payment" and attempts["charge"] == 0:
+                attempts["charge"] += 1
+                raise TaskExecutionError("first charge attempt fails")
+            return {"action": config.action, "status": "success"}
+
+        with (
+            patch("executor.execute_task", side_effect=flaky_charge),
+            patch("executor.get_step_for_execution", wraps=get_step_for_execution) as reread,
+        ):
+            execute_run(run_id)
+
+        assert get_run_detail(conn, run_id)["status"] == "completed"
+        assert reread.call_count == 1
+
     def test_retry_then_succeed_via_mock(self, conn):
         """Step fails twice then succeeds on third attempt. Verifies retry loop."""
         wf = CreateWorkflowRequest(
@@ -797,7 +1088,7 @@ class TestExecuteRun:
         assert run["status"] == "completed"
 
         steps = get_steps_for_run(conn, run_id)
-        assert all(s["status"] == "completed" for s in steps)
+        assert {s["status"] for s in steps} == {"completed"}
         # First step retry_count should still be 0 (wasn't re-executed)
         assert steps[0]["retry_count"] == 0
 
@@ -832,36 +1123,134 @@ class TestExecuteRun:
         run = get_run_detail(conn, run_id)
         assert run["status"] == "completed"
 
-        step = get_steps_for_run(conn, run_id)[0]
+        step = get_step_by_id(conn, step_rows[0]["id"])
         assert step["status"] == "completed"
         assert step["idempotency_key"] == idem_key  # key reused
 
+    def test_definition_cached_per_workflow(self, conn, sample_workflow):
+        """Definitions are parsed and step configs validated once per workflow."""
+        wf_id, _, _ = _create_full_run(conn, sample_workflow)
+        definition = get_workflow(conn, wf_id)["definition"]
+
+        parsed = parse_definition(wf_id, definition)
+        assert parse_definition(wf_id, definition) is parsed
+        assert [s["id"] for s in parsed["steps"]] == ["validate", "charge", "ship"]
+
+        configs = _step_configs(wf_id, definition)
+        assert _step_configs(wf_id, definition) is configs
+        assert isinstance(configs["charge"], WorkflowStepConfig)
+        assert configs["charge"].max_retries == 2
+
+        steps = parse_steps(wf_id, definition)
+        assert parse_steps(wf_id, definition) is steps
+        assert steps == tuple(sample_workflow.steps)
+        assert configs["charge"] is steps[1].config
+        with pytest.raises(ValidationError):
+            configs["charge"].max_retries = 5  # shared across runs: frozen
+
+    def test_run_and_first_step_running_committed_together(self, conn, sample_workflow):
+        """While the first task executes, other connections see both the run
+        and its first step as 'running'."""
+        _, run_id, step_rows = _create_full_run(conn, sample_workflow)
+        observed = []
+
+        def observing_task(config):
+            other = get_connection()
+            try:
+                observed.append((
+                    get_run_detail(other, run_id)["status"],
+                    get_step_by_id(other, step_rows[0]["id"])["status"],
+                ))
+            finally:
+                other.close()
+            return {"status": "success"}
+
+        with patch("executor.execute_task", side_effect=observing_task):
+            execute_run(run_id)
+
+        assert observed[0] == ("running", "running")
+        assert get_run_detail(conn, run_id)["status"] == "completed"
+
     def test_execute_run_nonexistent_run(self, conn):
         """execute_run with bad run_id should return gracefully (no crash)."""
         execute_run("nonexistent-id")
         # No exception raised — just logged and returned
 
-    def test_start_run_thread(self, conn, sample_workflow):
-        """start_run_thread spawns a daemon thread that completes the run."""
+    def test_submit_run(self, conn, sample_workflow):
+        """submit_run executes the run on the worker pool."""
         _, run_id, _ = _create_full_run(conn, sample_workflow)
 
-        thread = start_run_thread(run_id)
-        thread.join(timeout=10)
+        future = submit_run(run_id)
+        future.result(timeout=10)
 
-        assert not thread.is_alive()
+        assert future.done()
 
         run = get_run_detail(conn, run_id)
         assert run["status"] == "completed"
 
 
+    def test_submit_run_bounded_pool(self, conn, sample_workflow):
+        """More runs than workers all complete, on at most RUN_POOL_MAX_WORKERS threads."""
+        wf_id = create_workflow(conn, sample_workflow.name, sample_workflow.model_dump_json())
+        run_ids = []
+        for _ in range(RUN_POOL_MAX_WORKERS + 4):
+            run_id = create_run(conn, wf_id)
+            create_steps(conn, run_id, sample_workflow.steps)
+            run_ids.append(run_id)
+
+        workers = set()
+
+        def recording_task(config):
+            workers.add(threading.get_ident())
+            return {"action": config.action, "status": "success"}
+
+        with patch("executor.execute_task", side_effect=recording_task):
+            for future in [submit_run(run_id) for run_id in run_ids]:
+                future.result(timeout=10)
+
+        assert all(get_run_detail(conn, r)["status"] == "completed" for r in run_ids)
+        assert len(workers) <= RUN_POOL_MAX_WORKERS
+
 # ==================================================================
 # Test 11: recover_interrupted_runs — crash recovery (Phase 6)
 # ==================================================================
 class TestCrashRecovery:
     def test_recover_no_interrupted_runs(self, conn):
-        """No running runs → returns empty list, no threads spawned."""
-        threads = recover_interrupted_runs()
-        assert threads == []
+        """No running runs → returns empty list, nothing submitted."""
+        futures = recover_interrupted_runs()
+        assert futures == []
+
+    def test_active_run_queries_use_partial_index(self, conn):
+        """Recovery and running-run lookups each read a partial index, not the whole runs table."""
+        for query, index in [
+            (get_resumable_runs_with_definitions, "idx_runs_active"),
+            (get_running_runs, "idx_runs_status"),
+        ]:
+            statements = []
+            conn.set_trace_callback(statements.append)
+            query(conn)
+            conn.set_trace_callback(None)
+
+            (sql,) = statements
+            plan = " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            assert f"USING INDEX {index}" in plan, sql
+
+    def test_recovery_sweep_hands_definitions_to_runs(self, conn, sample_workflow):
+        """The sweep's JOIN supplies each run's definition; resumed runs never re-read it."""
+        wf_id = create_workflow(conn, sample_workflow.name, sample_workflow.model_dump_json())
+        for _ in range(3):
+            run_id = create_run(conn, wf_id)
+            create_steps(conn, run_id, sample_workflow.steps)
+            update_run_status(conn, run_id, "running", started_at=_now())
+        conn.commit()
+
+        with count_queries() as statements, patch("executor.get_run_with_definition") as reread:
+            for future in recover_interrupted_runs():
+                future.result(timeout=10)
+
+        reread.assert_not_called()
+        assert len(_selects(statements)) == 1 + 3
+        assert {r["status"] for r in get_all_runs(conn)} == {"completed"}
 
     def test_recover_single_interrupted_run(self, conn, sample_workflow):
         """One 'running' run is found and resumed to completion."""
@@ -871,17 +1260,17 @@ class TestCrashRecovery:
         update_run_status(conn, run_id, "running", started_at=_now())
         conn.commit()
 
-        threads = recover_interrupted_runs()
-        assert len(threads) == 1
-        threads[0].join(timeout=10)
+        futures = recover_interrupted_runs()
+        assert len(futures) == 1
+        futures[0].result(timeout=10)
 
         run = get_run_detail(conn, run_id)
         assert run["status"] == "completed"
-        assert all(s["status"] == "completed" for s in get_steps_for_run(conn, run_id))
+        assert {s["status"] for s in get_steps_for_run(conn, run_id)} == {"completed"}
 
     def test_recover_multiple_interrupted_runs(self, conn, sample_workflow):
         """Two 'running' runs are both resumed."""
-        wf_id = create_workflow(conn, sample_workflow.name, json.dumps(sample_workflow.model_dump()))
+        wf_id = create_workflow(conn, sample_workflow.name, sample_workflow.model_dump_json())
 
         run_a_id = create_run(conn, wf_id)
         create_steps(conn, run_a_id, sample_workflow.steps)
@@ -892,17 +1281,21 @@ class TestCrashRecovery:
         update_run_status(conn, run_b_id, "running", started_at=_now())
         conn.commit()
 
-        threads = recover_interrupted_runs()
-        assert len(threads) == 2
-        for t in threads:
-            t.join(timeout=10)
+        with count_queries() as statements:
+            futures = recover_interrupted_runs()
+            assert len(futures) == 2
+            for f in futures:
+                f.result(timeout=10)
 
         assert get_run_detail(conn, run_a_id)["status"] == "completed"
         assert get_run_detail(conn, run_b_id)["status"] == "completed"
+        # One sweep, then one step read per run: no per-run or per-step re-reads
+        assert len(_selects(statements)) == 1 + 2
 
     def test_recover_ignores_completed_and_pending(self, conn, sample_workflow):
-        """Only 'running' runs are recovered — completed and pending are ignored."""
-        wf_id = create_workflow(conn, sample_workflow.name, json.dumps(sample_workflow.model_dump()))
+        """Only running runs and queued pending runs (with steps) are recovered;
+        completed runs and stepless pending runs are ignored."""
+        wf_id = create_workflow(conn, sample_workflow.name, sample_workflow.model_dump_json())
 
         # Completed run
         run_done_id = create_run(conn, wf_id)
@@ -918,14 +1311,84 @@ class TestCrashRecovery:
         update_run_status(conn, run_active_id, "running", started_at=_now())
         conn.commit()
 
-        threads = recover_interrupted_runs()
-        assert len(threads) == 1
-        threads[0].join(timeout=10)
+        futures = recover_interrupted_runs()
+        assert len(futures) == 1
+        futures[0].result(timeout=10)
 
         assert get_run_detail(conn, run_active_id)["status"] == "completed"
         assert get_run_detail(conn, run_done_id)["status"] == "completed"
         assert get_run_detail(conn, run_pending_id)["status"] == "pending"
 
+    def test_running_runs_with_definitions(self, conn, sample_workflow):
+        """Recovery's bulk query carries the run detail columns plus the definition."""
+        wf_id, run_id, _ = _create_full_run(conn, sample_workflow)
+        update_run_status(conn, run_id, "running", started_at=_now())
+        conn.commit()
+
+        rows = get_resumable_runs_with_definitions(conn)
+        assert len(rows) == 1
+        assert rows[0]["id"] == run_id
+        assert rows[0]["workflow_name"] == "order-processing"
+        assert rows[0]["definition"] == get_workflow(conn, wf_id)["definition"]
+
+    def test_recover_queued_pending_run(self, conn, sample_workflow):
+        """A run queued but never started (pending, with steps) is resumed."""
+        _, run_id, _ = _create_full_run(conn, sample_workflow)
+
+        futures = recover_interrupted_runs()
+        assert len(futures) == 1
+        futures[0].result(timeout=10)
+        assert get_run_detail(conn, run_id)["status"] == "completed"
+
+    def test_shutdown_leaves_run_to_recovery(self, conn, sample_workflow):
+        """After shutdown_run_pool(), an executing run stops before its next
+        step and is left 'running' for recovery instead of being finished."""
+        _, run_id, _ = _create_full_run(conn, sample_workflow)
+        started, release = threading.Event(), threading.Event()
+
+        def blocking_task(config):
+            started.set()
+            release.wait(timeout=10)
+            return {"action": config.action, "status": "success"}
+
+        with patch("executor.execute_task", side_effect=blocking_task):
+            future = submit_run(run_id)
+            assert started.wait(timeout=10)
+            shutdown_run_pool()
+            release.set()
+            future.result(timeout=10)
+
+        assert get_run_detail(conn, run_id)["status"] == "running"
+        assert [s["status"] for s in get_steps_for_run(conn, run_id)] == ["completed", "pending", "pending"]
+
+        futures = recover_interrupted_runs()  # starts a fresh pool
+        assert len(futures) == 1
+        futures[0].result(timeout=10)
+        assert get_run_detail(conn, run_id)["status"] == "completed"
+
+    def test_worker_connections_closed_when_threads_exit(self, conn, sample_workflow):
+        """Once shutdown_run_pool(wait=True) returns, its workers' connections are closed."""
+        database.close_thread_connections()
+        _, run_id, _ = _create_full_run(conn, sample_workflow)
+        submit_run(run_id).result(timeout=10)
+        (worker,) = database._thread_connections
+        worker_conn = worker.conn
+        del worker
+
+        shutdown_run_pool(wait=True)
+        assert not database._thread_connections
+        with pytest.raises(sqlite3.ProgrammingError):
+            worker_conn.execute("SELECT 1")
+
+    def test_run_with_definition(self, conn, sample_workflow):
+        """execute_run's single startup query: run detail columns plus definition."""
+        wf_id, run_id, _ = _create_full_run(conn, sample_workflow)
+
+        row = get_run_with_definition(conn, run_id)
+        assert dict(get_run_detail(conn, run_id)).items() <= dict(row).items()
+        assert row["definition"] == get_workflow(conn, wf_id)["definition"]
+        assert get_run_with_definition(conn, "fake-id") is None
+
     def test_started_at_preserved_on_recovery(self, conn, sample_workflow):
         """Recovery should NOT overwrite the original started_at timestamp."""
         _, run_id, _ = _create_full_run(conn, sample_workflow)
@@ -934,9 +1397,9 @@ class TestCrashRecovery:
         update_run_status(conn, run_id, "running", started_at=original_started_at)
         conn.commit()
 
-        threads = recover_interrupted_runs()
-        assert len(threads) == 1
-        threads[0].join(timeout=10)
+        futures = recover_interrupted_runs()
+        assert len(futures) == 1
+        futures[0].result(timeout=10)
 
         run = get_run_detail(conn, run_id)
         assert run["status"] == "completed"
@@ -1017,7 +1480,7 @@ class TestTopologicalSort:
 
         steps = get_steps_for_run(conn, run_id)
         assert [s["step_id"] for s in steps] == ["A", "B", "C"]
-        assert all(s["status"] == "completed" for s in steps)
+        assert {s["status"] for s in steps} == {"completed"}
 
     def test_no_dependencies_preserves_order(self, conn):
         """Steps with no depends_on keep their original array order."""
@@ -1050,6 +1513,17 @@ class TestTopologicalSort:
                 ],
             )
 
+    def test_validation_error_precedence(self):
+        """Duplicates are reported before missing deps; the first missing dep in step order wins."""
+        def step(sid, *deps):
+            return WorkflowStep(id=sid, type="task", config=WorkflowStepConfig(action=sid),
+                                depends_on=list(deps))
+
+        with pytest.raises(ValueError, match="Duplicate step id: 'B'"):
+            CreateWorkflowRequest(name="dup", steps=[step("A", "missing"), step("B"), step("B")])
+        with pytest.raises(ValueError, match="Step 'B' depends on 'x'"):
+            CreateWorkflowRequest(name="missing", steps=[step("A"), step("B", "A", "x"), step("C", "y")])
+
     def test_self_cycle_detection(self):
         """A step depending on itself is a cycle."""
         with pytest.raises(ValueError, match="Circular dependency"):
@@ -1126,15 +1600,15 @@ class TestTopologicalSort:
         conn.commit()
 
         # Recovery resumes and finishes remaining steps
-        threads = recover_interrupted_runs()
-        assert len(threads) == 1
-        threads[0].join(timeout=10)
+        futures = recover_interrupted_runs()
+        assert len(futures) == 1
+        futures[0].result(timeout=10)
 
         run = get_run_detail(conn, run_id)
         assert run["status"] == "completed"
 
         steps = get_steps_for_run(conn, run_id)
-        assert all(s["status"] == "completed" for s in steps)
+        assert {s["status"] for s in steps} == {"completed"}
         # First step was not re-executed
         assert steps[0]["retry_count"] == 0
 
@@ -1194,6 +1668,18 @@ class TestActionDispatch:
         with pytest.raises(ValueError, match="expected 'pending'"):
             validate_order(conn, order_id)
 
+    def test_validate_order_nonpositive_amount(self, conn):
+        """validate_order raises (and leaves status alone) when amount <= 0."""
+        from actions import validate_order
+
+        order_id = create_order(conn, 49.99)
+        conn.execute("UPDATE orders SET amount = 0 WHERE id = ?", (order_id,))
+        conn.commit()
+
+        with pytest.raises(ValueError, match="must be > 0"):
+            validate_order(conn, order_id)
+        assert get_order(conn, order_id)["status"] == "pending"
+
     def test_charge_payment_happy(self, conn):
         """charge_payment transitions validated -> charged."""
         from actions import charge_payment
@@ -1307,7 +1793,7 @@ class TestActionDispatch:
             ],
         )
 
-        definition_json = json.dumps(wf.model_dump())
+        definition_json = wf.model_dump_json()
         wf_id = create_workflow(conn, wf.name, definition_json)
         run_id = create_run(conn, wf_id, order_id=order_id)
         create_steps(conn, run_id, wf.steps)
@@ -1333,7 +1819,7 @@ class TestActionDispatch:
                 ),
             ],
         )
-        definition_json = json.dumps(wf.model_dump())
+        definition_json = wf.model_dump_json()
         wf_id = create_workflow(conn, wf.name, definition_json)
         run_id = create_run(conn, wf_id)
         create_steps(conn, run_id, wf.steps)
@@ -1358,7 +1844,7 @@ class TestActionDispatch:
                 ),
             ],
         )
-        definition_json = json.dumps(wf.model_dump())
+        definition_json = wf.model_dump_json()
         wf_id = create_workflow(conn, wf.name, definition_json)
         run_id = create_run(conn, wf_id, order_id=order_id)
         create_steps(conn, run_id, wf.steps)
@@ -1389,7 +1875,7 @@ class TestActionDispatch:
                 ),
             ],
         )
-        definition_json = json.dumps(wf.model_dump())
+        definition_json = wf.model_dump_json()
         wf_id = create_workflow(conn, wf.name, definition_json)
         run_id = create_run(conn, wf_id, order_id=order_id)
         create_steps(conn, run_id, wf.steps)